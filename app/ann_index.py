@@ -0,0 +1,123 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index over the embedding
+matrix, in pure numpy.
+
+Items are clustered with spherical k-means; a query scores the centroids,
+then only the items in its `nprobe` closest clusters. Built by
+import_data.py and stored as data/ann_ivf.npz next to the database. The
+embedding store is written in cluster order, so each cluster is a
+contiguous slice of the memory-mapped matrix.
+"""
+
+import os
+import numpy as np
+
+from app.embedding_store import score_rows
+
+INDEX_FILE = "ann_ivf.npz"
+_BLOCK = 8192
+
+
+def index_path(db_path):
+    return os.path.join(os.path.dirname(db_path), INDEX_FILE)
+
+
+def _normalize(m):
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _assign(matrix, centroids):
+    out = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], _BLOCK):
+        block = np.asarray(matrix[start:start + _BLOCK], dtype=np.float32)
+        out[start:start + _BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(matrix, n_lists, iters=10, sample=None, seed=0):
+    """Spherical k-means centroids (unit-norm float32, shape (n_lists, dim))."""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    if sample is not None and n > sample:
+        train = np.asarray(matrix[np.sort(rng.choice(n, sample, replace=False))], dtype=np.float32)
+    else:
+        train = np.asarray(matrix, dtype=np.float32)
+    centroids = train[rng.choice(train.shape[0], n_lists, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _assign(train, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[nonempty])[:-1]))
+        centroids[nonempty] = np.add.reduceat(train[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            centroids[empty] = train[rng.choice(train.shape[0], empty.size, replace=False)]
+        centroids = _normalize(centroids).astype(np.float32)
+    return centroids
+
+
+def build_ivf(ids, matrix, n_lists=None, iters=10, seed=0):
+    """Cluster every row of matrix. n_lists defaults to sqrt(N).
+
+    Returns (index, order): rows must be stored as ids[order] /
+    matrix[order] for the index's cluster offsets to apply.
+    """
+    n = matrix.shape[0]
+    if not n_lists:
+        n_lists = int(np.sqrt(n))
+    n_lists = max(1, min(n_lists, n))
+    centroids = kmeans(matrix, n_lists, iters=iters, sample=max(256 * n_lists, 50000), seed=seed)
+    assign = _assign(matrix, centroids)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+    index = {
+        "ids": np.asarray(ids, dtype=np.int64)[order],
+        "centroids": centroids,
+        "offsets": offsets.astype(np.int64),
+    }
+    return index, order
+
+
+def save_ivf(db_path, index):
+    path = index_path(db_path)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **index)
+    os.replace(tmp, path)
+
+
+def load_ivf(db_path, ids):
+    """Load the index if it exists and was built for exactly these ids."""
+    path = index_path(db_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as data:
+            index = {k: data[k] for k in ("ids", "centroids", "offsets")}
+    except (OSError, ValueError, KeyError):
+        return None
+    if not np.array_equal(index["ids"], ids):
+        return None
+    return index
+
+
+def remove_ivf(db_path):
+    path = index_path(db_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def probe(index, matrix, query_vec, nprobe, scales=None):
+    """Candidate row positions from the nprobe closest clusters, and their scores.
+    matrix may be the float32 store or its quantized copy (with scales)."""
+    centroids = index["centroids"]
+    nprobe = min(nprobe, centroids.shape[0])
+    cscores = centroids @ query_vec
+    lists = np.sort(np.argpartition(-cscores, nprobe - 1)[:nprobe])
+    offsets = index["offsets"]
+    positions = np.concatenate([np.arange(offsets[c], offsets[c + 1]) for c in lists])
+    scores = np.concatenate([score_rows(matrix, scales, query_vec, offsets[c], offsets[c + 1]) for c in lists])
+    return positions, scores
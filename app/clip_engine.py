@@ -1,8 +1,16 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import torch
 from PIL import Image
 import open_clip
 
+MODEL_NAME = "ViT-B-32"
+PRETRAINED = "laion2b_s34b_b79k"
+MODEL_TAG = f"{MODEL_NAME}/{PRETRAINED}"
+
 _model = None
 _preprocess = None
 _tokenizer = None
@@ -13,9 +21,9 @@ def init_clip():
     global _model, _preprocess, _tokenizer, _device
     _device = "cuda" if torch.cuda.is_available() else "cpu"
     _model, _, _preprocess = open_clip.create_model_and_transforms(
-        "ViT-B-32", pretrained="laion2b_s34b_b79k"
+        MODEL_NAME, pretrained=PRETRAINED
     )
-    _tokenizer = open_clip.get_tokenizer("ViT-B-32")
+    _tokenizer = open_clip.get_tokenizer(MODEL_NAME)
     _model = _model.to(_device)
     _model.eval()
 
@@ -32,6 +40,88 @@ def encode_image(image_path):
     return features.cpu().numpy().flatten()
 
 
+def _load_image(image_path):
+    try:
+        return _preprocess(Image.open(image_path).convert("RGB"))
+    except Exception as e:
+        return e
+
+
+def iter_encode_images(paths, batch_size=32, workers=4, prefetch=2):
+    """Encode image files in batches, yielding (path, vector, error) in input order.
+
+    A loader thread decodes and preprocesses each batch on a pool of
+    `workers` threads and hands it over through a queue holding at most
+    `prefetch` batches, so image decoding overlaps with model inference.
+    `paths` may be any iterable and is consumed lazily. Images that fail to
+    load yield vector=None and the exception as `error`.
+    """
+    if _model is None:
+        init_clip()
+
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def loader():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                batch = []
+                for path in paths:
+                    batch.append(path)
+                    if len(batch) == batch_size:
+                        put((batch, list(pool.map(_load_image, batch))))
+                        batch = []
+                        if stop.is_set():
+                            return
+                if batch:
+                    put((batch, list(pool.map(_load_image, batch))))
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target=loader, name="clip-image-loader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            batch_paths, loaded = item
+            ok = [i for i, t in enumerate(loaded) if not isinstance(t, Exception)]
+            vectors = {}
+            if ok:
+                img_tensor = torch.stack([loaded[i] for i in ok]).to(_device)
+                with torch.no_grad():
+                    features = _model.encode_image(img_tensor)
+                features = features / features.norm(dim=-1, keepdim=True)
+                vectors = dict(zip(ok, features.cpu().numpy()))
+            for i, path in enumerate(batch_paths):
+                if i in vectors:
+                    yield path, vectors[i], None
+                else:
+                    yield path, None, loaded[i]
+    finally:
+        stop.set()
+        thread.join()
+
+
+def encode_images(paths, batch_size=32, workers=4):
+    """Encode many image files; returns a list of vectors (None where loading failed)."""
+    return [vec for _, vec, _ in iter_encode_images(paths, batch_size, workers)]
+
+
 def encode_text(text):
     """Encode a text query into a normalized embedding vector."""
     if _model is None:
@@ -43,5 +133,17 @@ def encode_text(text):
     return features.cpu().numpy().flatten()
 
 
+def encode_texts(texts):
+    """Encode several text queries in one forward pass; returns an
+    (n, dim) array of normalized embeddings."""
+    if _model is None:
+        init_clip()
+    tokens = _tokenizer(list(texts)).to(_device)
+    with torch.no_grad():
+        features = _model.encode_text(tokens)
+    features = features / features.norm(dim=-1, keepdim=True)
+    return features.cpu().numpy().astype(np.float32)
+
+
 def cosine_similarity(vec_a, vec_b):
     return float(np.dot(vec_a, vec_b))
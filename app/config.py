@@ -11,6 +11,7 @@ def load_config():
     cfg["_base_dir"] = BASE_DIR
     cfg["_db_path"] = os.path.join(BASE_DIR, "data", "inventory.db")
     cfg["_thumb_dir"] = os.path.join(BASE_DIR, "thumbnails")
+    cfg["_thumb_manifest"] = os.path.join(cfg["_thumb_dir"], "manifest.json")
     cfg["_static_dir"] = os.path.join(BASE_DIR, "static")
 
     if not os.path.isabs(cfg.get("spreadsheet", "")):
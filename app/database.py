@@ -1,8 +1,90 @@
 import os
+import re
+import json
+import time
+import zlib
 import sqlite3
+import threading
 import numpy as np
 
 DB_PATH = None
+BULK_BATCH_SIZE = 2000
+
+# Prefix indexes make short "xy*" / "xyz*" queries index lookups instead of
+# term scans. items_fts_vocab lists every indexed term, which search.py uses
+# to drop synonyms the catalog never mentions.
+_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        name, category, extra_data,
+        content='items',
+        content_rowid='id',
+        prefix='2 3 4'
+    )
+"""
+_FTS_VOCAB = "CREATE VIRTUAL TABLE IF NOT EXISTS items_fts_vocab USING fts5vocab(items_fts, 'row')"
+
+# Keep items_fts in step with items. Bulk loads drop the relevant trigger
+# and rebuild the index once at the end instead. items_au only fires for the
+# indexed columns, so writes to attr_*, duplicate_of etc. leave the index alone.
+_FTS_TRIGGERS = {
+    "items_ai": """
+        CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts(rowid, name, category, extra_data)
+            VALUES (new.id, new.name, new.category, new.extra_data);
+        END""",
+    "items_ad": """
+        CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, name, category, extra_data)
+            VALUES ('delete', old.id, old.name, old.category, old.extra_data);
+        END""",
+    "items_au": """
+        CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE OF name, category, extra_data ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, name, category, extra_data)
+            VALUES ('delete', old.id, old.name, old.category, old.extra_data);
+            INSERT INTO items_fts(rowid, name, category, extra_data)
+            VALUES (new.id, new.name, new.category, new.extra_data);
+        END""",
+}
+
+# Settings for the long-lived read connections used on the serving path.
+READ_MMAP_SIZE = 256 * 1024 * 1024
+READ_CACHE_KB = 64 * 1024
+READ_CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+# What the serving path reads for an item. ITEM_JSON builds the API shape
+# inside SQLite, splicing the stored extra_data JSON in as an object, so
+# responses need no per-row dicts or json.loads.
+ITEM_COLUMNS = "id, name, category, extra_data, image_file, thumb_file, thumb_variants"
+ITEM_JSON = (
+    "json_object('id', id, 'name', name, 'category', category, "
+    "'image_file', image_file, 'thumb_file', thumb_file, "
+    "'thumbs', CASE WHEN json_valid(thumb_variants) THEN json(thumb_variants) ELSE json('{}') END, "
+    "'extra', CASE WHEN json_valid(extra_data) THEN json(extra_data) ELSE json('{}') END)"
+)
+
+
+# Typed copies of configured extra_data fields (config.yaml
+# columns.attributes), stored as indexed attr_<name> columns on items so
+# searches can filter on them in SQL. name -> (extra_data key, type).
+ATTRIBUTE_TYPES = {"real": "REAL", "integer": "INTEGER", "boolean": "INTEGER"}
+_ATTRIBUTE_NAME = re.compile(r"^[a-z][a-z0-9_]*$")
+ATTRIBUTES = {}
+
+
+def configure_attributes(spec):
+    """Set ATTRIBUTES from config: {name: {"column": ..., "type": ...}}."""
+    global ATTRIBUTES
+    attrs = {}
+    for name, opts in (spec or {}).items():
+        if not _ATTRIBUTE_NAME.match(name):
+            raise ValueError(f"attribute name must be lower_snake_case: {name!r}")
+        if opts.get("type", "real") not in ATTRIBUTE_TYPES:
+            raise ValueError(f"attribute {name!r}: type must be one of {', '.join(ATTRIBUTE_TYPES)}")
+        attrs[name] = (opts["column"], opts.get("type", "real"))
+    ATTRIBUTES = attrs
+
 
 def _connect():
     conn = sqlite3.connect(DB_PATH)
@@ -11,6 +93,35 @@ def _connect():
     return conn
 
 
+def _read_conn():
+    """Per-thread read-only connection, opened once and reused.
+
+    Reopened if DB_PATH changes or the process has forked (e.g. gunicorn
+    --preload), since SQLite connections must not cross a fork. Writers
+    keep using _connect().
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key == (DB_PATH, os.getpid()):
+        return conn
+    conn = sqlite3.connect(DB_PATH, cached_statements=READ_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only=ON")
+    conn.execute(f"PRAGMA mmap_size={READ_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{READ_CACHE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _local.conn = conn
+    _local.key = (DB_PATH, os.getpid())
+    return conn
+
+
+def close_read_conn():
+    """Close this thread's read connection, if it has one."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+
 def init_db(db_path):
     global DB_PATH
     DB_PATH = db_path
@@ -25,132 +136,632 @@ def init_db(db_path):
             extra_data  TEXT DEFAULT '',
             image_file  TEXT DEFAULT '',
             thumb_file  TEXT DEFAULT '',
-            embedding   BLOB
+            thumb_variants TEXT DEFAULT '',
+            row_key     TEXT,
+            row_hash    TEXT,
+            image_hash  TEXT
         );
 
-        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
-            name, category, extra_data,
-            content='items',
-            content_rowid='id'
+        CREATE TABLE IF NOT EXISTS item_embeddings (
+            item_id     INTEGER PRIMARY KEY,
+            embedding   BLOB NOT NULL
         );
 
-        CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
-            INSERT INTO items_fts(rowid, name, category, extra_data)
-            VALUES (new.id, new.name, new.category, new.extra_data);
+        CREATE TRIGGER IF NOT EXISTS items_emb_ad AFTER DELETE ON items BEGIN
+            DELETE FROM item_embeddings WHERE item_id = old.id;
         END;
 
-        CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
-            INSERT INTO items_fts(items_fts, rowid, name, category, extra_data)
-            VALUES ('delete', old.id, old.name, old.category, old.extra_data);
-        END;
+        CREATE TABLE IF NOT EXISTS item_neighbors (
+            item_id      INTEGER PRIMARY KEY,
+            neighbor_ids BLOB NOT NULL,
+            scores       BLOB NOT NULL
+        );
 
-        CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE ON items BEGIN
-            INSERT INTO items_fts(items_fts, rowid, name, category, extra_data)
-            VALUES ('delete', old.id, old.name, old.category, old.extra_data);
-            INSERT INTO items_fts(rowid, name, category, extra_data)
-            VALUES (new.id, new.name, new.category, new.extra_data);
+        CREATE TRIGGER IF NOT EXISTS items_nb_ad AFTER DELETE ON items BEGIN
+            DELETE FROM item_neighbors WHERE item_id = old.id;
         END;
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key         TEXT PRIMARY KEY,
+            value       INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS image_files (
+            path        TEXT PRIMARY KEY,
+            size        INTEGER,
+            mtime       REAL,
+            sha1        TEXT
+        );
+
     """)
+    conn.execute(_FTS_TABLE)
+    conn.execute(_FTS_VOCAB)
+    for sql in _FTS_TRIGGERS.values():
+        conn.execute(sql)
+    _migrate(conn)
     conn.commit()
     conn.close()
 
 
+def _migrate(conn):
+    """Bring a database created by an older version up to the current schema."""
+    have = {r["name"] for r in conn.execute("PRAGMA table_info(items)")}
+    for col in ("row_key", "row_hash", "image_hash"):
+        if col not in have:
+            conn.execute(f"ALTER TABLE items ADD COLUMN {col} TEXT")
+    if "thumb_variants" not in have:
+        conn.execute("ALTER TABLE items ADD COLUMN thumb_variants TEXT DEFAULT ''")
+    if "duplicate_of" not in have:
+        conn.execute("ALTER TABLE items ADD COLUMN duplicate_of INTEGER")
+    if "embedding" in have:
+        conn.execute(
+            "INSERT OR IGNORE INTO item_embeddings (item_id, embedding) "
+            "SELECT id, embedding FROM items WHERE embedding IS NOT NULL"
+        )
+        try:
+            conn.execute("ALTER TABLE items DROP COLUMN embedding")
+        except sqlite3.OperationalError:
+            # SQLite < 3.35 can't drop columns; just stop storing data there.
+            conn.execute("UPDATE items SET embedding = NULL WHERE embedding IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_items_row_key ON items(row_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_items_image_hash ON items(image_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_items_name ON items(name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_items_duplicate_group ON items(coalesce(duplicate_of, id))")
+    have = {r["name"] for r in conn.execute("PRAGMA table_info(items)")}
+    added = [name for name in ATTRIBUTES if f"attr_{name}" not in have]
+    for name in added:
+        conn.execute(f"ALTER TABLE items ADD COLUMN attr_{name} {ATTRIBUTE_TYPES[ATTRIBUTES[name][1]]}")
+    _fill_attributes(conn, added)
+    if added and added == list(ATTRIBUTES):
+        _save_attributes_signature(conn)
+    for name in ATTRIBUTES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_items_attr_{name} ON items(attr_{name})")
+    au_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'items_au'").fetchone()[0]
+    if "UPDATE OF" not in au_sql:
+        conn.execute("DROP TRIGGER items_au")
+        conn.execute(_FTS_TRIGGERS["items_au"])
+    fts_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'items_fts'").fetchone()[0]
+    if "prefix" not in fts_sql:
+        conn.execute("DROP TABLE items_fts")
+        conn.execute(_FTS_TABLE)
+        conn.execute("INSERT INTO items_fts(items_fts) VALUES('rebuild')")
+
+
 def clear_items():
+    """Delete every item, emptying the FTS index in one step rather than
+    through the per-row delete trigger."""
     conn = _connect()
+    conn.execute("DROP TRIGGER IF EXISTS items_ad")
+    conn.execute("DELETE FROM item_embeddings")
+    conn.execute("DELETE FROM item_neighbors")
     conn.execute("DELETE FROM items")
-    conn.execute("DELETE FROM items_fts")
+    conn.execute("INSERT INTO items_fts(items_fts) VALUES('delete-all')")
+    conn.execute(_FTS_TRIGGERS["items_ad"])
     conn.commit()
     conn.close()
 
 
-def insert_item(name, category, extra_data, image_file, thumb_file, embedding_vector):
-    emb_blob = None
-    if embedding_vector is not None:
-        emb_blob = np.array(embedding_vector, dtype=np.float32).tobytes()
+def bulk_insert_items(rows, batch_size=BULK_BATCH_SIZE):
+    """Insert many items in large transactions, committing every `batch_size` rows.
 
+    rows is any iterable of (name, category, extra_data, image_file,
+    thumb_file, embedding_vector, row_key, row_hash, image_hash,
+    thumb_variants) tuples and
+    is consumed lazily. Once there is more than one batch, the per-row FTS
+    insert trigger is dropped for the duration and items_fts is rebuilt
+    once at the end; smaller loads go through the trigger. Returns the
+    number of rows inserted.
+    """
     conn = _connect()
-    cur = conn.execute(
-        "INSERT INTO items (name, category, extra_data, image_file, thumb_file, embedding) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (name, category, extra_data, image_file, thumb_file, emb_blob),
+    count = 0
+    bulk = False
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) > batch_size:
+                if not bulk:
+                    conn.execute("DROP TRIGGER IF EXISTS items_ai")
+                    bulk = True
+                count += _insert_batch(conn, batch[:batch_size])
+                batch = batch[batch_size:]
+        if batch:
+            count += _insert_batch(conn, batch)
+    finally:
+        if bulk:
+            conn.execute(_FTS_TRIGGERS["items_ai"])
+            conn.execute("INSERT INTO items_fts(items_fts) VALUES('rebuild')")
+            conn.commit()
+        conn.close()
+    return count
+
+
+def _insert_batch(conn, batch):
+    conn.executemany(_insert_item_sql(), [
+        (name, category, extra_data, image_file, thumb_file, thumb_variants, row_key, row_hash, image_hash,
+         *_attribute_values(extra_data))
+        for (name, category, extra_data, image_file, thumb_file, _, row_key, row_hash, image_hash,
+             thumb_variants) in batch
+    ])
+    # AUTOINCREMENT ids only grow and this connection holds the write lock,
+    # so the batch got the len(batch) ids ending at last_insert_rowid().
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    first_id = last_id - len(batch) + 1
+    conn.executemany(_UPSERT_EMBEDDING, [
+        (first_id + i, _embedding_blob(row[5])) for i, row in enumerate(batch) if row[5] is not None
+    ])
+    conn.commit()
+    return len(batch)
+
+
+def _insert_item_sql():
+    """INSERT for one item, attr_<name> columns included (they depend on
+    configure_attributes, so this is built per call)."""
+    columns = ["name", "category", "extra_data", "image_file", "thumb_file", "thumb_variants",
+               "row_key", "row_hash", "image_hash"] + [f"attr_{name}" for name in ATTRIBUTES]
+    return f"INSERT INTO items ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+
+_UPSERT_EMBEDDING = "INSERT OR REPLACE INTO item_embeddings (item_id, embedding) VALUES (?, ?)"
+
+
+def parse_attribute(value, kind):
+    """Spreadsheet text -> typed value ("$1,200.00" -> 1200.0, "Yes" -> 1), or None."""
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if kind == "boolean":
+        if text in ("yes", "y", "true", "t", "1", "x"):
+            return 1
+        if text in ("no", "n", "false", "f", "0", ""):
+            return 0
+        return None
+    try:
+        number = float(text.replace("$", "").replace(",", ""))
+    except ValueError:
+        return None
+    return int(number) if kind == "integer" else number
+
+
+def _attribute_values(extra_data):
+    """The attr_<name> values for an item's extra_data, in ATTRIBUTES order."""
+    if not ATTRIBUTES:
+        return []
+    try:
+        extra = json.loads(extra_data) if extra_data else {}
+    except ValueError:
+        extra = {}
+    if not isinstance(extra, dict):
+        extra = {}
+    return [parse_attribute(extra.get(key), kind) for key, kind in ATTRIBUTES.values()]
+
+
+def refresh_attributes():
+    """Recompute the attr_<name> columns from extra_data after the
+    attribute config has changed. Inserts and updates already fill them, so
+    with an unchanged config this is one meta lookup; otherwise only rows
+    whose values differ are rewritten."""
+    if not ATTRIBUTES:
+        return
+    conn = _connect()
+    row = conn.execute("SELECT value FROM meta WHERE key = 'attributes'").fetchone()
+    if row is None or row[0] != _attributes_signature():
+        _fill_attributes(conn, list(ATTRIBUTES))
+        _save_attributes_signature(conn)
+        conn.commit()
+    conn.close()
+
+
+def _attributes_signature():
+    return zlib.crc32(json.dumps(sorted(ATTRIBUTES.items())).encode("utf-8"))
+
+
+def _save_attributes_signature(conn):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('attributes', ?)", (_attributes_signature(),))
+
+
+def _fill_attributes(conn, names):
+    if not names:
+        return
+    conn.create_function(
+        "parse_attribute", 3,
+        lambda extra, key, kind: parse_attribute(_extra_value(extra, key), kind),
+        deterministic=True,
+    )
+    assignments = ", ".join(f"attr_{name} = parse_attribute(extra_data, ?, ?)" for name in names)
+    changed = " OR ".join(f"attr_{name} IS NOT parse_attribute(extra_data, ?, ?)" for name in names)
+    params = [v for name in names for v in ATTRIBUTES[name]]
+    conn.execute(f"UPDATE items SET {assignments} WHERE {changed}", params + params)
+
+
+def _extra_value(extra_data, key):
+    try:
+        return json.loads(extra_data).get(key) if extra_data else None
+    except (ValueError, AttributeError):
+        return None
+
+
+def filter_sql(filters, table="items", dedup=False):
+    """SQL predicate for {attribute: (low, high)} range filters (either end
+    may be None; low == high is equality). With dedup, only the lowest-id
+    item of each duplicate group (see set_duplicates) that passes the
+    filters is kept. Returns (sql, params); sql is "" when there is
+    nothing to filter."""
+    clauses, params = _range_clauses(filters, table)
+    if dedup:
+        inner, inner_params = _range_clauses(filters, "dup")
+        clauses.append(
+            f"NOT EXISTS (SELECT 1 FROM items dup WHERE {_DUPLICATE_GROUP.format(t='dup')} = "
+            f"{_DUPLICATE_GROUP.format(t=table)} AND dup.id < {table}.id"
+            + "".join(f" AND {c}" for c in inner) + ")"
+        )
+        params += inner_params
+    return " AND ".join(clauses), params
+
+
+# An item's duplicate group: the item it duplicates, or itself.
+# idx_items_duplicate_group indexes exactly this expression.
+_DUPLICATE_GROUP = "coalesce({t}.duplicate_of, {t}.id)"
+
+
+def _range_clauses(filters, table):
+    clauses, params = [], []
+    for name, (low, high) in sorted((filters or {}).items()):
+        if name not in ATTRIBUTES:
+            raise ValueError(f"unknown attribute: {name}")
+        column = f"{table}.attr_{name}"
+        if low is not None and low == high:
+            clauses.append(f"{column} = ?")
+            params.append(low)
+            continue
+        if low is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"{column} <= ?")
+            params.append(high)
+    return clauses, params
+
+
+def get_filtered_ids(filters):
+    """Ids of the items matching filter_sql(filters), as an int64 array."""
+    where, params = filter_sql(filters)
+    conn = _read_conn()
+    rows = conn.execute(f"SELECT id FROM items WHERE {where}", params).fetchall()
+    return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+
+def bump_generation():
+    """Mark the catalog as changed. Servers compare this counter to decide
+    when cached results and the loaded embedding matrix are stale."""
+    conn = _connect()
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
     )
+    conn.commit()
+    conn.close()
+
+
+def get_generation():
+    row = _read_conn().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return row[0] if row else 0
+
+
+def _embedding_blob(embedding_vector):
+    if embedding_vector is None:
+        return None
+    return np.array(embedding_vector, dtype=np.float32).tobytes()
+
+
+def insert_item(name, category, extra_data, image_file, thumb_file, embedding_vector,
+                row_key=None, row_hash=None, image_hash=None, thumb_variants=""):
+    conn = _connect()
+    cur = conn.execute(_insert_item_sql(), (name, category, extra_data, image_file, thumb_file,
+                                            thumb_variants, row_key, row_hash, image_hash,
+                                            *_attribute_values(extra_data)))
     item_id = cur.lastrowid
+    if embedding_vector is not None:
+        conn.execute(_UPSERT_EMBEDDING, (item_id, _embedding_blob(embedding_vector)))
     conn.commit()
     conn.close()
     return item_id
 
 
-def text_search(query, limit=60):
-    """FTS5 search — returns list of (id, rank) tuples.
-    Query can be pre-formatted with OR operators from expand_query."""
+def update_item(item_id, name, category, extra_data, image_file, thumb_file, embedding_vector,
+                row_hash=None, image_hash=None, keep_embedding=False, thumb_variants=""):
+    """Rewrite an existing row in place. With keep_embedding the stored
+    embedding is left alone and embedding_vector is ignored; otherwise the
+    image changed, so the item leaves its duplicate group and the rest of
+    the group stays together."""
     conn = _connect()
-    if " OR " in query:
-        fts_query = query
-    else:
-        fts_query = " OR ".join(query.strip().split())
-    try:
+    attrs = "".join(f", attr_{name} = ?" for name in ATTRIBUTES)
+    conn.execute(
+        "UPDATE items SET name = ?, category = ?, extra_data = ?, image_file = ?, "
+        f"thumb_file = ?, thumb_variants = ?, row_hash = ?, image_hash = ?{attrs} WHERE id = ?",
+        (name, category, extra_data, image_file, thumb_file, thumb_variants,
+         row_hash, image_hash, *_attribute_values(extra_data), item_id),
+    )
+    if not keep_embedding:
+        conn.execute("UPDATE items SET duplicate_of = NULL WHERE id = ?", (item_id,))
+        _rehome_duplicates(conn, item_id)
+        if embedding_vector is None:
+            conn.execute("DELETE FROM item_embeddings WHERE item_id = ?", (item_id,))
+        else:
+            conn.execute(_UPSERT_EMBEDDING, (item_id, _embedding_blob(embedding_vector)))
+    conn.commit()
+    conn.close()
+
+
+def delete_items(ids):
+    """Delete items by id. A deleted item's duplicates are regrouped under
+    the lowest surviving id (see _rehome_duplicates)."""
+    if not ids:
+        return
+    conn = _connect()
+    conn.executemany("DELETE FROM items WHERE id = ?", [(i,) for i in ids])
+    for item_id in ids:
+        _rehome_duplicates(conn, item_id)
+    conn.commit()
+    conn.close()
+
+
+def _rehome_duplicates(conn, kept_id):
+    """kept_id has left its duplicate group (deleted, or a new image): the
+    lowest remaining member becomes the kept item and the rest point at it."""
+    row = conn.execute(
+        "SELECT min(id) FROM items WHERE coalesce(duplicate_of, id) = ? AND id != ?", (kept_id, kept_id)
+    ).fetchone()
+    if row[0] is None:
+        return
+    conn.execute(
+        "UPDATE items SET duplicate_of = CASE WHEN id = ?1 THEN NULL ELSE ?1 END "
+        "WHERE coalesce(duplicate_of, id) = ?2 AND id != ?2",
+        (row[0], kept_id),
+    )
+
+
+def get_import_state():
+    """Returns {row_key: (id, row_hash, image_hash)} for rows written by an import."""
+    conn = _connect()
+    rows = conn.execute(
+        "SELECT id, row_key, row_hash, image_hash FROM items WHERE row_key IS NOT NULL"
+    ).fetchall()
+    conn.close()
+    return {r["row_key"]: (r["id"], r["row_hash"], r["image_hash"]) for r in rows}
+
+
+def get_embeddings_for_image_hashes(hashes):
+    """Returns {image_hash: numpy_vector} for hashes that already have an embedding."""
+    hashes = list(hashes)
+    found = {}
+    conn = _connect()
+    for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        placeholders = ",".join("?" for _ in chunk)
         rows = conn.execute(
-            "SELECT rowid, rank FROM items_fts WHERE items_fts MATCH ? ORDER BY rank LIMIT ?",
-            (fts_query, limit),
+            f"SELECT i.image_hash, e.embedding FROM items i "
+            f"JOIN item_embeddings e ON e.item_id = i.id "
+            f"WHERE i.image_hash IN ({placeholders})",
+            chunk,
         ).fetchall()
-    except Exception:
-        fts_query = " OR ".join(query.strip().split())
-        rows = conn.execute(
+        for r in rows:
+            found[r["image_hash"]] = np.frombuffer(r["embedding"], dtype=np.float32)
+    conn.close()
+    return found
+
+
+def get_thumbnail_names():
+    """Every thumbnail file referenced by an item, primary and srcset variants."""
+    conn = _read_conn()
+    names = set()
+    for r in conn.execute("SELECT thumb_file, thumb_variants FROM items"):
+        if r["thumb_file"]:
+            names.add(r["thumb_file"])
+        if r["thumb_variants"]:
+            for files in json.loads(r["thumb_variants"]).values():
+                names.update(files.values())
+    return names
+
+
+def get_image_fingerprints():
+    """Returns {path: (size, mtime, sha1)} recorded by earlier imports."""
+    conn = _connect()
+    rows = conn.execute("SELECT path, size, mtime, sha1 FROM image_files").fetchall()
+    conn.close()
+    return {r["path"]: (r["size"], r["mtime"], r["sha1"]) for r in rows}
+
+
+def save_image_fingerprints(fingerprints):
+    conn = _connect()
+    conn.executemany(
+        "INSERT OR REPLACE INTO image_files (path, size, mtime, sha1) VALUES (?, ?, ?, ?)",
+        [(path, size, mtime, sha1) for path, (size, mtime, sha1) in fingerprints.items()],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _fts_rows(conn, fts_query, limit, where="", params=()):
+    if not where:
+        return conn.execute(
             "SELECT rowid, rank FROM items_fts WHERE items_fts MATCH ? ORDER BY rank LIMIT ?",
             (fts_query, limit),
         ).fetchall()
-    conn.close()
+    return conn.execute(
+        "SELECT items_fts.rowid AS rowid, rank FROM items_fts JOIN items ON items.id = items_fts.rowid "
+        f"WHERE items_fts MATCH ? AND {where} ORDER BY rank LIMIT ?",
+        (fts_query, *params, limit),
+    ).fetchall()
+
+
+def text_search(query, limit=60, timeout=None, filters=None):
+    """FTS5 search — returns list of (id, rank) tuples.
+    Query can be pre-formatted with OR operators from expand_query.
+    With a timeout (seconds), a search still running after it is interrupted
+    and returns no results. filters (see filter_sql) are applied in the
+    same query, so LIMIT counts matching items only."""
+    where, params = filter_sql(filters)
+    conn = _read_conn()
+    if " OR " in query or '"' in query:
+        fts_query = query
+    else:
+        fts_query = " OR ".join(query.strip().split())
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        try:
+            rows = _fts_rows(conn, fts_query, limit, where, params)
+        except Exception as e:
+            if "interrupted" in str(e):
+                raise
+            # Quoted words can't be FTS5 syntax errors, whatever punctuation they hold.
+            words = query.replace(" OR ", " ").replace('"', " ").split()
+            rows = _fts_rows(conn, " OR ".join(f'"{w}"' for w in words), limit, where, params) if words else []
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            return []
+        raise
+    finally:
+        if timeout is not None:
+            conn.set_progress_handler(None, 0)
     return [(r["rowid"], r["rank"]) for r in rows]
 
 
+def get_fts_vocab():
+    """Every term in the full-text index, sorted."""
+    conn = _read_conn()
+    return [r[0] for r in conn.execute("SELECT term FROM items_fts_vocab ORDER BY term")]
+
+
 def get_all_embeddings():
-    """Returns list of (id, numpy_vector) for items that have embeddings."""
-    conn = _connect()
+    """Returns (ids, matrix) for items that have embeddings.
+    ids is an int64 array and matrix a contiguous float32 array with one
+    row per id, so callers can score every item with a single matmul."""
+    conn = _read_conn()
     rows = conn.execute(
-        "SELECT id, embedding FROM items WHERE embedding IS NOT NULL"
+        "SELECT item_id, embedding FROM item_embeddings ORDER BY item_id"
     ).fetchall()
-    conn.close()
-    results = []
-    for r in rows:
-        vec = np.frombuffer(r["embedding"], dtype=np.float32)
-        results.append((r["id"], vec))
-    return results
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    ids = np.fromiter((r["item_id"] for r in rows), dtype=np.int64, count=len(rows))
+    matrix = np.frombuffer(b"".join(r["embedding"] for r in rows), dtype=np.float32)
+    matrix = matrix.reshape(len(rows), -1).copy()
+    return ids, matrix
 
 
-def get_items_by_ids(ids):
-    """Fetch full item rows for a list of IDs, preserving order."""
+def get_items_by_ids(ids, as_json=False):
+    """Fetch item rows for a list of IDs, preserving order.
+    With as_json, each item is returned as a ready-to-send JSON string."""
     if not ids:
         return []
-    conn = _connect()
+    conn = _read_conn()
     placeholders = ",".join("?" for _ in ids)
+    if as_json:
+        rows = conn.execute(
+            f"SELECT id, {ITEM_JSON} FROM items WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        row_map = {r[0]: r[1] for r in rows}
+    else:
+        rows = conn.execute(
+            f"SELECT {ITEM_COLUMNS} FROM items WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        row_map = {r["id"]: dict(r) for r in rows}
+    return [row_map[i] for i in ids if i in row_map]
+
+
+def get_image_refs():
+    """id, name, thumb_file and image_hash of every item, by id."""
+    conn = _read_conn()
     rows = conn.execute(
-        f"SELECT * FROM items WHERE id IN ({placeholders})", ids
+        "SELECT id, name, thumb_file, image_hash FROM items ORDER BY id"
     ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def set_duplicates(duplicate_of):
+    """Replace the duplicate flags: {item id: id of the item it duplicates}.
+    Every other item is marked as not a duplicate."""
+    conn = _connect()
+    conn.execute("UPDATE items SET duplicate_of = NULL WHERE duplicate_of IS NOT NULL")
+    conn.executemany("UPDATE items SET duplicate_of = ? WHERE id = ?",
+                     [(canonical, item_id) for item_id, canonical in duplicate_of.items()])
+    conn.commit()
     conn.close()
-    row_map = {r["id"]: dict(r) for r in rows}
-    return [row_map[i] for i in ids if i in row_map]
 
 
-def get_all_items(limit=2000, offset=0):
+def get_duplicate_map():
+    """{item id: duplicate_of} for every flagged item."""
+    conn = _read_conn()
+    return dict(conn.execute("SELECT id, duplicate_of FROM items WHERE duplicate_of IS NOT NULL").fetchall())
+
+
+def save_neighbors(rows):
+    """Replace every item's similar-item list with rows of
+    (item id, neighbour ids, scores), e.g. from neighbors.nearest_neighbors."""
     conn = _connect()
+    conn.execute("DELETE FROM item_neighbors")
+    conn.executemany(
+        "INSERT INTO item_neighbors (item_id, neighbor_ids, scores) VALUES (?, ?, ?)",
+        ((item_id, np.asarray(nb, dtype=np.int64).tobytes(), np.asarray(sc, dtype=np.float32).tobytes())
+         for item_id, nb, sc in rows),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_neighbors(item_id):
+    """(neighbour ids, scores) stored for an item, best first, or None."""
+    conn = _read_conn()
+    row = conn.execute(
+        "SELECT neighbor_ids, scores FROM item_neighbors WHERE item_id = ?", (item_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return np.frombuffer(row[0], dtype=np.int64), np.frombuffer(row[1], dtype=np.float32)
+
+
+def get_all_items(limit=2000, offset=0, as_json=False, filters=None, dedup=False):
+    where, params = filter_sql(filters, dedup=dedup)
+    conn = _read_conn()
     rows = conn.execute(
-        "SELECT * FROM items ORDER BY name LIMIT ? OFFSET ?", (limit, offset)
+        f"SELECT {ITEM_JSON if as_json else ITEM_COLUMNS} FROM items "
+        f"{'WHERE ' + where if where else ''} ORDER BY name, id LIMIT ? OFFSET ?",
+        (*params, limit, offset),
     ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return [r[0] for r in rows] if as_json else [dict(r) for r in rows]
+
+
+def get_items_page(after=None, limit=60, as_json=False, filters=None, dedup=False):
+    """One page of items in (name, id) order, starting after the (name, id)
+    key `after`. Unlike OFFSET, every page is a seek on idx_items_name.
+    Returns (items, key of the last row, or None if this is the last page)."""
+    where, params = filter_sql(filters, dedup=dedup)
+    clauses = [where] if where else []
+    if after is not None:
+        clauses.append("(name, id) > (?, ?)")
+        params = [*params, after[0], after[1]]
+    select = f"SELECT name, id, {ITEM_JSON} AS item FROM items" if as_json else f"SELECT {ITEM_COLUMNS} FROM items"
+    conn = _read_conn()
+    rows = conn.execute(
+        f"{select} {'WHERE ' + ' AND '.join(clauses) if clauses else ''} ORDER BY name, id LIMIT ?",
+        (*params, limit),
+    ).fetchall()
+    items = [r["item"] for r in rows] if as_json else [dict(r) for r in rows]
+    last = (rows[-1]["name"], rows[-1]["id"]) if rows and len(rows) == limit else None
+    return items, last
 
 
 def get_item_count():
-    conn = _connect()
+    conn = _read_conn()
     count = conn.execute("SELECT COUNT(*) as c FROM items").fetchone()["c"]
-    conn.close()
     return count
 
 
 def get_categories():
-    conn = _connect()
+    conn = _read_conn()
     rows = conn.execute(
         "SELECT DISTINCT category FROM items WHERE category != '' ORDER BY category"
     ).fetchall()
-    conn.close()
     return [r["category"] for r in rows]
@@ -0,0 +1,74 @@
+"""
+Near-duplicate detection over the catalog.
+
+Two items are linked when they share an image (the same image hash or
+thumbnail, both derived from the file's content), or when their image
+embeddings have cosine similarity at or above a threshold. image_file is
+not compared: import stores the product name there, not the image. Linked
+items are grouped with union-find. find_duplicates.py reports the
+groups and can flag every item except each group's first one with
+items.duplicate_of, which search can then collapse (hybrid_search
+dedup=True).
+
+The embedding pass compares every pair once, a block of rows at a time
+against the rows after them. Memory stays within BLOCK_BYTES, so it runs
+on 100k-item catalogs, but time grows with the square of the catalog size.
+"""
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.97
+BLOCK_BYTES = 64 * 2**20
+
+
+def embedding_pairs(ids, matrix, threshold=DEFAULT_THRESHOLD):
+    """Yield (id_a, id_b, similarity) for each pair of rows at or above
+    threshold. matrix rows are L2-normalized float32."""
+    n = matrix.shape[0]
+    block = max(1, BLOCK_BYTES // (4 * max(n, 1)))
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        # Only columns after each row: every pair is scored once.
+        scores = matrix[start:stop] @ matrix[start:].T
+        rows, cols = np.nonzero(np.triu(scores, 1) >= threshold)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            yield int(ids[start + r]), int(ids[start + c]), float(scores[r, c])
+
+
+def shared_image_pairs(items):
+    """Yield (id_a, id_b, reason) linking items that share an image, from
+    dicts with id, thumb_file and image_hash."""
+    for field in ("thumb_file", "image_hash"):
+        first = {}
+        for item in items:
+            value = item.get(field)
+            if not value:
+                continue
+            if value in first:
+                yield first[value], item["id"], field
+            else:
+                first[value] = item["id"]
+
+
+def group(pairs):
+    """Union-find over (id_a, id_b, ...) pairs: a list of groups, each a
+    sorted list of ids, largest groups first."""
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b, *_ in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    groups = {}
+    for x in parent:
+        groups.setdefault(find(x), []).append(x)
+    return sorted((sorted(g) for g in groups.values()), key=lambda g: (-len(g), g[0]))
@@ -0,0 +1,144 @@
+"""
+Flat on-disk copy of the item embeddings, written by import_data.py.
+
+The matrix is a plain .npy file opened with mmap, so every gunicorn worker
+shares the same OS page-cache pages instead of unpacking its own copy of
+every SQLite BLOB at startup.
+
+Optionally a compact int8 copy is written alongside it. Search then scans
+the compact copy and re-scores only its best candidates against the float32
+rows, so the full-precision file is mostly left on disk. That trades some
+scan time (the rows are cast to float32 a block at a time) for a quarter
+of the resident memory.
+"""
+
+import os
+import numpy as np
+
+MATRIX_FILE = "embeddings.npy"
+IDS_FILE = "embedding_ids.npy"
+QUANTIZED_FILES = {"int8": "embeddings_i8.npy"}
+SCALES_FILE = "embedding_scales.npy"
+# Compact copies older versions could write; removed when the store is rewritten.
+_OLD_QUANTIZED_FILES = ("embeddings_f16.npy",)
+STORE_DTYPES = ("float32",) + tuple(QUANTIZED_FILES)
+_BLOCK = 256
+
+
+def store_paths(db_path):
+    data_dir = os.path.dirname(db_path)
+    return os.path.join(data_dir, MATRIX_FILE), os.path.join(data_dir, IDS_FILE)
+
+
+def _quantized_path(db_path, name):
+    return os.path.join(os.path.dirname(db_path), name)
+
+
+def _quantized_files(db_path):
+    files = {name: _quantized_path(db_path, f) for name, f in QUANTIZED_FILES.items()}
+    files["scales"] = _quantized_path(db_path, SCALES_FILE)
+    for name in _OLD_QUANTIZED_FILES:
+        files[name] = _quantized_path(db_path, name)
+    return files
+
+
+def _save_atomic(path, arr):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def quantize(matrix, dtype):
+    """Compact copy of a float32 matrix as (rows, scales).
+
+    int8 rows are scaled per vector so each row's largest component maps
+    to 127; row * scale approximates the original.
+    """
+    if dtype != "int8":
+        raise ValueError(f"unknown embedding store dtype: {dtype}")
+    if matrix.shape[0] == 0:
+        return np.empty(matrix.shape, dtype=np.int8), np.empty(0, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    rows = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return rows, scales.astype(np.float32)
+
+
+def score_rows(matrix, scales, query_vec, start=0, stop=None):
+    """matrix[start:stop] @ query_vec for a float32 or quantized matrix.
+    query_vec may also be a (dim, n) matrix of n queries, scored together.
+
+    Compact rows are cast to float32 a block at a time, so the scan
+    streams the small file through cache without an N x dim temporary.
+    """
+    stop = matrix.shape[0] if stop is None else stop
+    if matrix.dtype == np.float32:
+        return matrix[start:stop] @ query_vec
+    out = np.empty((stop - start,) + query_vec.shape[1:], dtype=np.float32)
+    for i in range(start, stop, _BLOCK):
+        j = min(i + _BLOCK, stop)
+        out[i - start:j - start] = matrix[i:j].astype(np.float32) @ query_vec
+    if scales is not None:
+        out *= scales[start:stop].reshape((-1,) + (1,) * (out.ndim - 1))
+    return out
+
+
+def write_store(db_path, ids, matrix, dtype="float32"):
+    """Write ids and float32 rows, plus a compact copy unless dtype is float32."""
+    matrix_path, ids_path = store_paths(db_path)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    _save_atomic(ids_path, np.ascontiguousarray(ids, dtype=np.int64))
+    _save_atomic(matrix_path, matrix)
+
+    for name, path in _quantized_files(db_path).items():
+        if name != dtype and os.path.exists(path):
+            os.remove(path)
+    if dtype == "float32":
+        return
+    rows, scales = quantize(matrix, dtype)
+    if scales is not None:
+        _save_atomic(_quantized_path(db_path, SCALES_FILE), scales)
+    _save_atomic(_quantized_path(db_path, QUANTIZED_FILES[dtype]), rows)
+
+
+def load_store(db_path):
+    """Returns (ids, matrix) with the matrix memory-mapped read-only,
+    or None if the store is missing or its two files disagree."""
+    matrix_path, ids_path = store_paths(db_path)
+    if not (os.path.isfile(matrix_path) and os.path.isfile(ids_path)):
+        return None
+    try:
+        ids = np.load(ids_path)
+        matrix = np.load(matrix_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if matrix.ndim != 2 or matrix.shape[0] != ids.shape[0]:
+        return None
+    return ids, matrix
+
+
+def load_quantized(db_path, n_rows):
+    """Returns (rows, scales) for the compact copy, memory-mapped, or None
+    if there is none or it doesn't match an n_rows store."""
+    for name in QUANTIZED_FILES:
+        path = _quantized_path(db_path, QUANTIZED_FILES[name])
+        if not os.path.isfile(path):
+            continue
+        try:
+            rows = np.load(path, mmap_mode="r")
+            scales = np.load(_quantized_path(db_path, SCALES_FILE))
+        except (OSError, ValueError):
+            return None
+        if rows.ndim != 2 or rows.shape[0] != n_rows:
+            return None
+        if scales is not None and scales.shape != (n_rows,):
+            return None
+        return rows, scales
+    return None
+
+
+def remove_store(db_path):
+    for path in list(store_paths(db_path)) + list(_quantized_files(db_path).values()):
+        if os.path.exists(path):
+            os.remove(path)
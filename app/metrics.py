@@ -0,0 +1,146 @@
+"""
+Per-stage timers for the search hot path.
+
+Code wraps each stage in `with stage("fts"):`. Each timing goes into a
+process-wide histogram, exposed in Prometheus text format by /metrics. It
+is also added to the current request's list, which server.py sends back
+as a Server-Timing header. While disabled, stage() returns one shared
+no-op context manager, so the timers cost a function call each.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+enabled = False
+_histograms = {}
+_lock = threading.Lock()
+_local = threading.local()
+_NOOP = nullcontext()
+# Histogram name -> (label name, help text) for /metrics.
+_HISTOGRAMS = {
+    "search_stage_seconds": ("stage", "Time spent in each stage of a search request."),
+    "http_request_duration_seconds": ("route", "Time to answer a request, by route."),
+}
+
+
+def configure(enable=True):
+    global enabled
+    enabled = enable
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+def observe(metric, label, seconds):
+    """Record one duration in the histogram metric{label}."""
+    with _lock:
+        hist = _histograms.get((metric, label))
+        if hist is None:
+            hist = _histograms[(metric, label)] = _Histogram()
+        hist.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist.total += seconds
+        hist.count += 1
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        observe("search_stage_seconds", self.name, seconds)
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            timings.append((self.name, seconds))
+        return False
+
+
+def stage(name):
+    """Context manager timing one stage of the current request."""
+    return _Stage(name) if enabled else _NOOP
+
+
+def start_request():
+    """Begin collecting stage timings for the request on this thread."""
+    if enabled:
+        _local.timings = []
+
+
+def end_request():
+    """Stop collecting; returns this request's [(stage, seconds), ...]."""
+    timings = getattr(_local, "timings", None)
+    _local.timings = None
+    return timings or []
+
+
+def bind(fn):
+    """Wrap fn so that, run on another thread (a search leg), its stages
+    are also reported in the calling request's timings."""
+    timings = getattr(_local, "timings", None) if enabled else None
+    if timings is None:
+        return fn
+
+    def run(*args, **kwargs):
+        _local.timings = timings
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.timings = None
+
+    return run
+
+
+def server_timing(timings):
+    """Server-Timing header value, summing repeated stages."""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(gauges=()):
+    """All histograms plus `gauges` ((name, help, type, {label: value}) tuples,
+    label "" meaning none) in Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        by_metric = {}
+        for (metric, label), hist in sorted(_histograms.items()):
+            by_metric.setdefault(metric, []).append((label, hist.counts[:], hist.total, hist.count))
+    for metric, series in by_metric.items():
+        key, help_text = _HISTOGRAMS.get(metric, ("label", metric))
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for label, counts, total, count in series:
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{key}="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{key}="{label}"}} {total!r}')
+            lines.append(f'{metric}_count{{{key}="{label}"}} {count}')
+    for name, help_text, kind, values in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for label, value in values.items():
+            lines.append(f"{name}{{{label}}} {_format_value(value)}" if label else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,72 @@
+"""
+Precomputed "more like this" lists.
+
+At the end of an import, nearest_neighbors() finds every item's top-k most
+similar items by image embedding, and database.save_neighbors stores
+them. /api/items/<id>/similar is then one primary-key lookup with no
+model or matrix work.
+
+The score matrix is built a block of rows at a time, never larger than
+BLOCK_BYTES. Small catalogs are compared all-pairs, exactly. When import
+has built the IVF index (large catalogs), each cluster's rows are compared
+only with the rows of the nprobe clusters nearest to it. That takes the
+cost from n^2 to about n^2 * nprobe / n_lists.
+"""
+
+import numpy as np
+
+DEFAULT_K = 24
+BLOCK_BYTES = 64 * 2**20
+
+
+def _best(scores, k):
+    """Per row of scores: the column indices of the k highest, best first,
+    and those scores."""
+    part = np.argpartition(scores, scores.shape[1] - k, axis=1)[:, -k:]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def _score_block(ids, matrix, start, stop, cand, base, k):
+    """Rows start..stop against candidate rows cand (None = every row), in
+    which row `start` sits at position `base`."""
+    others = matrix if cand is None else matrix[cand]
+    block = max(1, BLOCK_BYTES // (4 * others.shape[0]))
+    for i in range(start, stop, block):
+        j = min(i + block, stop)
+        scores = matrix[i:j] @ others.T
+        rows = np.arange(j - i)
+        scores[rows, base + i - start + rows] = -np.inf
+        best, best_scores = _best(scores, k)
+        if cand is not None:
+            best = cand[best]
+        for r in range(j - i):
+            yield int(ids[i + r]), ids[best[r]], best_scores[r]
+
+
+def nearest_neighbors(ids, matrix, k=DEFAULT_K, index=None, nprobe=32):
+    """Yield (item id, neighbour ids, scores) for every row, best first and
+    excluding the item itself. matrix rows are L2-normalized float32; with
+    an IVF index (ann_index.build_ivf), rows must be in the index's order."""
+    n = matrix.shape[0]
+    if index is None:
+        k = min(k, n - 1)
+        if k > 0:
+            yield from _score_block(ids, matrix, 0, n, None, 0, k)
+        return
+
+    centroids, offsets = index["centroids"], index["offsets"]
+    nprobe = min(nprobe, centroids.shape[0])
+    near = np.argsort(-(centroids @ centroids.T), axis=1)[:, :nprobe]
+    for c in range(centroids.shape[0]):
+        start, stop = int(offsets[c]), int(offsets[c + 1])
+        if start == stop:
+            continue
+        lists = np.union1d(near[c], [c])
+        sizes = offsets[lists + 1] - offsets[lists]
+        cand = np.concatenate([np.arange(offsets[l], offsets[l + 1]) for l in lists])
+        base = int(sizes[lists < c].sum())
+        kk = min(k, cand.size - 1)
+        if kk > 0:
+            yield from _score_block(ids, matrix, start, stop, cand, base, kk)
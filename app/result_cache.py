@@ -0,0 +1,61 @@
+"""
+Bounded cache of rendered API responses.
+
+Entries are tagged with the database generation they were built from
+(see database.bump_generation), so an import makes every older entry a
+miss without any explicit invalidation.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+_entries = OrderedDict()
+_max_entries = 512
+_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def configure(max_entries):
+    global _max_entries
+    _max_entries = max_entries
+
+
+def make_key(kind, query="", **params):
+    """Cache key for one response. Queries are compared case- and
+    whitespace-insensitively, matching how search treats them."""
+    return (kind, " ".join(query.lower().split()), tuple(sorted(params.items())))
+
+
+def get(key, generation):
+    """Returns (body, etag) if cached for this generation, else None."""
+    global hits, misses
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or entry[0] != generation:
+            misses += 1
+            return None
+        _entries.move_to_end(key)
+        hits += 1
+        return entry[1], entry[2]
+
+
+def etag(generation, body):
+    return f"g{generation}-" + hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]
+
+
+def put(key, generation, body):
+    """Store a response body and return its ETag."""
+    etag_value = etag(generation, body)
+    with _lock:
+        _entries[key] = (generation, body, etag_value)
+        _entries.move_to_end(key)
+        while len(_entries) > _max_entries:
+            _entries.popitem(last=False)
+    return etag_value
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -1,14 +1,81 @@
+import re
+import time
+import bisect
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
 import numpy as np
-from app.database import text_search, get_all_embeddings, get_items_by_ids, get_all_items, get_categories
+from app import database
+from app.metrics import stage, bind
+from app.embedding_store import load_store, load_quantized, score_rows
+from app.ann_index import load_ivf, probe
+from app.text_cache import cached_encode_text, cached_encode_texts
+from app.database import (
+    text_search, get_all_embeddings, get_items_by_ids, get_all_items, get_items_page, get_categories,
+    get_fts_vocab, get_filtered_ids, get_neighbors, get_duplicate_map,
+)
 
 _embedding_cache = None
+_ann_index = None
+_quantized = None
+_id_order = None
+_duplicates = None
 _clip_available = False
 
-try:
-    from app.clip_engine import encode_text, cosine_similarity
-    _clip_available = True
-except ImportError:
-    pass
+# Visual search probes the IVF index (when one was built and ANN_ENABLED)
+# for catalogs of at least ANN_MIN_ITEMS; smaller catalogs are scored exactly.
+ANN_ENABLED = True
+ANN_NPROBE = 64
+ANN_MIN_ITEMS = 100000
+
+# With a quantized store, this many coarse candidates (or the requested
+# limit, if larger) are re-scored against the float32 rows.
+RESCORE_TOP = 300
+
+# hybrid_search runs its visual leg on this shared pool while the text leg
+# runs on the request thread. A leg that misses its budget is dropped and
+# the request is answered from the other one.
+LEG_WORKERS = 4
+TEXT_BUDGET_MS = 300
+VISUAL_BUDGET_MS = 300
+# A batch's visual leg encodes every query, so its budget grows by this
+# much per query on top of VISUAL_BUDGET_MS.
+BATCH_VISUAL_MS_PER_QUERY = 50
+_leg_pool = None
+_leg_pool_lock = threading.Lock()
+leg_timeouts = {"text": 0, "visual": 0}
+
+# Query expansion spells a prefix out as the index terms it matches, unless
+# it matches more than this many or is short enough for the FTS prefix
+# index (database._FTS_TABLE); then FTS5 gets "prefix*".
+MAX_PREFIX_TERMS = 32
+PREFIX_INDEX_MAX = 4
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_vocab = None
+
+# search_page keeps each query's ranking (MAX_RESULTS ids deep) this long,
+# so later pages don't re-run the search. Cleared on a new import.
+MAX_RESULTS = 300
+RANKING_TTL = 600
+RANKING_CACHE_SIZE = 256
+_rankings = OrderedDict()
+_rankings_lock = threading.Lock()
+
+# visual_search_batch scores this many queries per pass over the rows,
+# bounding the (rows x queries) score matrix.
+BATCH_SCORE_QUERIES = 64
+
+# Attribute filters (database.filter_sql) become a boolean mask over the
+# embedding rows, cached per filter set. A mask selecting at most this
+# fraction of the catalog is scored by gathering just those rows, exactly;
+# looser ones are applied to the normal (ANN or full) scan.
+FILTER_GATHER_FRACTION = 0.1
+FILTER_MASK_CACHE_SIZE = 64
+_filter_masks = OrderedDict()
+_filter_masks_lock = threading.Lock()
 
 # Bidirectional synonym groups — every word in a group expands to all others.
 # This means searching ANY word in a group returns items matching ANY other word.
@@ -121,84 +188,355 @@ for group in _SYNONYM_GROUPS:
         SYNONYMS[word].update(all_words)
 
 
-def expand_query(query):
-    """Expand search terms with synonyms and prefix matching.
-    Returns an FTS5-safe OR query with broad matching."""
-    words = query.lower().split()
+def _fts_tokens(text):
+    """Split text the way FTS5's unicode61 tokenizer does: lower case,
+    diacritics removed, runs of letters and digits."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(text)
+
+
+def _get_vocab():
+    """Sorted terms of the full-text index, or None when there is no database."""
+    global _vocab
+    if _vocab is None and database.DB_PATH:
+        _vocab = get_fts_vocab()
+    return _vocab
+
+
+def _prefix_terms(token, vocab):
+    """Index terms for token* -- spelled out when there are only a few, a
+    prefix query (served by the FTS prefix index) when there are many, and
+    nothing when the catalog has no such term."""
+    if vocab is None:
+        return [token + "*"]
+    lo = bisect.bisect_left(vocab, token)
+    hi = bisect.bisect_left(vocab, token + "\U0010ffff", lo)
+    if hi - lo > MAX_PREFIX_TERMS or (hi - lo > 1 and len(token) <= PREFIX_INDEX_MAX):
+        return [token + "*"]
+    return vocab[lo:hi]
+
+
+def _in_vocab(token, vocab):
+    i = bisect.bisect_left(vocab, token)
+    return i < len(vocab) and vocab[i] == token
+
+
+def _synonym_terms(synonym, vocab):
+    tokens = _fts_tokens(synonym)
+    if len(tokens) == 1:
+        return _prefix_terms(tokens[0], vocab)
+    # Multi-word synonyms ("place setting", "off-white") match as a phrase.
+    if tokens and (vocab is None or all(_in_vocab(t, vocab) for t in tokens)):
+        return ['"' + " ".join(tokens) + '"']
+    return []
+
+
+@lru_cache(maxsize=4096)
+def _expand_word(word):
+    """FTS5 terms for one whitespace-separated query word, computed once
+    per word (per import generation)."""
+    vocab = _get_vocab()
     terms = set()
+    for token in _fts_tokens(word):
+        terms.update(_prefix_terms(token, vocab))
+    synonyms = set(SYNONYMS.get(word, ()))
+    if word.endswith("s"):
+        synonyms.update(SYNONYMS.get(word[:-1], ()))
+    synonyms.update(SYNONYMS.get(word + "s", ()))
+    for synonym in synonyms:
+        terms.update(_synonym_terms(synonym, vocab))
+    return frozenset(terms)
 
-    for word in words:
-        terms.add(word)
-        terms.add(word + "*")
-        if word in SYNONYMS:
-            for syn in SYNONYMS[word]:
-                terms.add(syn)
-                terms.add(syn + "*")
-        if word.endswith("s") and word[:-1] in SYNONYMS:
-            for syn in SYNONYMS[word[:-1]]:
-                terms.add(syn)
-                terms.add(syn + "*")
-        if (word + "s") in SYNONYMS:
-            for syn in SYNONYMS[word + "s"]:
-                terms.add(syn)
-                terms.add(syn + "*")
-
-    clean = set()
-    for t in terms:
-        if t.endswith("*"):
-            base = t[:-1]
-            if base not in terms:
-                clean.add(t)
-        else:
-            clean.add(t)
-            clean.add(t + "*")
 
-    return " OR ".join(sorted(clean))
+def expand_query(query):
+    """Expand search terms with synonyms and prefix matching.
+    Returns an FTS5-safe OR query with broad matching, or "" when no
+    term occurs in the catalog."""
+    terms = set()
+    for word in query.lower().split():
+        terms.update(_expand_word(word))
+    return " OR ".join(sorted(terms))
 
 
 def _load_embeddings():
-    global _embedding_cache
-    _embedding_cache = get_all_embeddings()
+    """Prefer the memory-mapped store written at import time; fall back to
+    scanning the items table when it hasn't been built yet."""
+    global _embedding_cache, _ann_index, _quantized
+    stored = load_store(database.DB_PATH) if database.DB_PATH else None
+    _embedding_cache = stored if stored is not None else get_all_embeddings()
+    _ann_index = load_ivf(database.DB_PATH, _embedding_cache[0]) if database.DB_PATH and ANN_ENABLED else None
+    _quantized = load_quantized(database.DB_PATH, len(_embedding_cache[0])) if stored is not None else None
     return _embedding_cache
 
 
 def invalidate_cache():
-    global _embedding_cache
+    global _embedding_cache, _ann_index, _quantized, _vocab, _id_order, _duplicates
     _embedding_cache = None
-
-
-def visual_search(query, limit=60):
+    _id_order = None
+    _duplicates = None
+    _ann_index = None
+    _quantized = None
+    _vocab = None
+    _expand_word.cache_clear()
+    with _rankings_lock:
+        _rankings.clear()
+    with _filter_masks_lock:
+        _filter_masks.clear()
+
+
+def enable_visual_search(enabled=True):
+    """Called by serve.py once a query encoder has been loaded."""
+    global _clip_available
+    _clip_available = enabled
+
+
+def configure_legs(workers=None, text_budget_ms=None, visual_budget_ms=None, batch_visual_ms_per_query=None):
+    """Apply search.legs settings from config.yaml."""
+    global LEG_WORKERS, TEXT_BUDGET_MS, VISUAL_BUDGET_MS, BATCH_VISUAL_MS_PER_QUERY
+    if batch_visual_ms_per_query is not None:
+        BATCH_VISUAL_MS_PER_QUERY = batch_visual_ms_per_query
+    if workers is not None:
+        LEG_WORKERS = workers
+    if text_budget_ms is not None:
+        TEXT_BUDGET_MS = text_budget_ms
+    if visual_budget_ms is not None:
+        VISUAL_BUDGET_MS = visual_budget_ms
+
+
+def _get_leg_pool():
+    global _leg_pool
+    if _leg_pool is None:
+        with _leg_pool_lock:
+            if _leg_pool is None:
+                _leg_pool = ThreadPoolExecutor(max_workers=LEG_WORKERS, thread_name_prefix="search-leg")
+    return _leg_pool
+
+
+def configure_paging(max_results=None, cursor_ttl=None):
+    """Apply search.paging settings from config.yaml."""
+    global MAX_RESULTS, RANKING_TTL
+    if max_results is not None:
+        MAX_RESULTS = max_results
+    if cursor_ttl is not None:
+        RANKING_TTL = cursor_ttl
+
+
+def configure_rescore(rescore=None):
+    """Apply search.rescore from config.yaml."""
+    global RESCORE_TOP
+    if rescore is not None:
+        RESCORE_TOP = rescore
+
+
+def configure_ann(enabled=None, nprobe=None, min_items=None, **_):
+    """Apply search.ann settings from config.yaml (build-time keys are ignored)."""
+    global ANN_ENABLED, ANN_NPROBE, ANN_MIN_ITEMS
+    if enabled is not None:
+        ANN_ENABLED = bool(enabled)
+    if nprobe is not None:
+        ANN_NPROBE = nprobe
+    if min_items is not None:
+        ANN_MIN_ITEMS = min_items
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first.
+    Uses argpartition so only the selected slice gets sorted."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(n)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def _filter_key(filters):
+    return tuple(sorted(filters.items()))
+
+
+def filter_mask(ids, filters):
+    """Boolean mask over the embedding rows `ids` of the items matching filters."""
+    key = _filter_key(filters)
+    with _filter_masks_lock:
+        mask = _filter_masks.get(key)
+        if mask is not None and mask.shape[0] == ids.shape[0]:
+            _filter_masks.move_to_end(key)
+            return mask
+    mask = np.isin(ids, get_filtered_ids(filters))
+    with _filter_masks_lock:
+        _filter_masks[key] = mask
+        while len(_filter_masks) > FILTER_MASK_CACHE_SIZE:
+            _filter_masks.popitem(last=False)
+    return mask
+
+
+def visual_search(query, limit=60, filters=None):
     if not _clip_available:
         return []
 
     embeddings = _embedding_cache if _embedding_cache is not None else _load_embeddings()
-    if not embeddings:
+    ids, matrix = embeddings
+    if ids.size == 0:
         return []
 
-    query_vec = encode_text(query)
-
-    scores = []
-    for item_id, emb_vec in embeddings:
-        sim = cosine_similarity(query_vec, emb_vec)
-        scores.append((item_id, sim))
-
-    scores.sort(key=lambda x: x[1], reverse=True)
-    return scores[:limit]
+    mask = filter_mask(ids, filters) if filters else None
+    matching = int(np.count_nonzero(mask)) if mask is not None else ids.size
+    if matching == 0:
+        return []
 
+    with stage("encode"):
+        query_vec = cached_encode_text(query)
+    with stage("score"):
+        return _score_visual(ids, matrix, mask, matching, query_vec, limit)
+
+
+def _score_visual(ids, matrix, mask, matching, query_vec, limit):
+    # Embeddings and queries are L2-normalized, so the dot product is the cosine.
+    if mask is not None and matching <= FILTER_GATHER_FRACTION * ids.size:
+        # Selective filter: score just the matching float32 rows, exactly.
+        positions = np.flatnonzero(mask)
+        scores = matrix[positions] @ query_vec
+        best = top_k(scores, limit)
+        return [(int(ids[positions[i]]), float(scores[i])) for i in best]
+
+    # The coarse pass runs over the quantized copy when there is one.
+    rows, scales = _quantized if _quantized is not None else (matrix, None)
+    if _ann_index is not None and ids.size >= ANN_MIN_ITEMS:
+        positions, scores = probe(_ann_index, rows, query_vec, ANN_NPROBE, scales)
+        if mask is not None:
+            keep = mask[positions]
+            positions, scores = positions[keep], scores[keep]
+    else:
+        positions, scores = None, score_rows(rows, scales, query_vec)
+        if mask is not None:
+            positions, scores = np.flatnonzero(mask), scores[mask]
+
+    return _top_rows(ids, matrix, positions, scores, query_vec, limit)
+
+
+def _top_rows(ids, matrix, positions, scores, query_vec, limit):
+    """Best `limit` (id, score) pairs from coarse scores of the rows at
+    `positions` (None = every row), re-scored in float32 if quantized."""
+    if _quantized is not None:
+        cand = top_k(scores, max(limit, RESCORE_TOP))
+        if positions is not None:
+            cand = positions[cand]
+        # Sorted positions keep the float32 reads in file order.
+        positions = np.sort(cand)
+        scores = matrix[positions] @ query_vec
+
+    best = top_k(scores, limit)
+    rows_found = positions[best] if positions is not None else best
+    return [(int(ids[p]), float(scores[i])) for p, i in zip(rows_found, best)]
+
+
+def visual_search_batch(queries, limit=60, filters=None):
+    """visual_search for many queries: one (batched) encoder pass, then one
+    pass over the embedding rows scoring every query as a matrix-matrix
+    product. The whole matrix is scanned even when there is an ANN index,
+    since one streamed GEMM serves all queries. Returns a list of
+    [(id, score), ...] per query."""
+    if not _clip_available or not queries:
+        return [[] for _ in queries]
 
-def hybrid_search(query, text_weight=0.4, visual_weight=0.6, limit=60):
+    embeddings = _embedding_cache if _embedding_cache is not None else _load_embeddings()
+    ids, matrix = embeddings
+    mask = filter_mask(ids, filters) if filters and ids.size else None
+    matching = int(np.count_nonzero(mask)) if mask is not None else ids.size
+    if matching == 0:
+        return [[] for _ in queries]
+
+    with stage("encode"):
+        query_vecs = cached_encode_texts(queries)
+    results = []
+    with stage("score"):
+        for start in range(0, len(queries), BATCH_SCORE_QUERIES):
+            block = query_vecs[start:start + BATCH_SCORE_QUERIES]
+            if mask is not None and matching <= FILTER_GATHER_FRACTION * ids.size:
+                positions = np.flatnonzero(mask)
+                scores = matrix[positions] @ block.T
+            else:
+                rows, scales = _quantized if _quantized is not None else (matrix, None)
+                positions, scores = None, score_rows(rows, scales, np.ascontiguousarray(block.T))
+                if mask is not None:
+                    positions, scores = np.flatnonzero(mask), scores[mask]
+            for j, query_vec in enumerate(block):
+                results.append(_top_rows(ids, matrix, positions, np.ascontiguousarray(scores[:, j]),
+                                         query_vec, limit))
+    return results
+
+
+def embedding_stats():
+    """(rows, bytes) of the loaded embedding store, counting the quantized
+    copy; (0, 0) before it has been loaded."""
+    if _embedding_cache is None:
+        return 0, 0
+    ids, matrix = _embedding_cache
+    size = ids.nbytes + matrix.nbytes
+    if _quantized is not None:
+        size += sum(a.nbytes for a in _quantized if a is not None)
+    return int(ids.size), int(size)
+
+
+def search_mode():
+    """"hybrid" once visual search is enabled, "text" while it is loading or unavailable."""
+    return "hybrid" if _clip_available else "text"
+
+
+def rank_hybrid(query, text_weight=0.4, visual_weight=0.6, limit=60, filters=None, dedup=False):
     """
-    Combine FTS5 text search and CLIP visual search.
+    Combine FTS5 text search and CLIP visual search into one ranking.
     Expands category terms so "blue furniture" finds sofas, chairs, tables, etc.
+    Both legs apply the attribute filters themselves, so every candidate
+    they return is eligible. With dedup, items flagged by find_duplicates.py
+    collapse to their group's best-ranked member.
+    Returns (ids best first, mode, complete) where mode is "hybrid" or
+    "text" depending on whether visual results took part, and complete is
+    False when a leg missed its budget, so the ranking shouldn't be cached.
     """
-    if not query or not query.strip():
-        return get_all_items(limit=limit)
-
-    expanded = expand_query(query)
-    text_results = text_search(expanded, limit=limit * 5)
-
-    vis_results = visual_search(query, limit=limit * 3) if _clip_available else []
-
+    started = time.monotonic()
+    vis_future = _get_leg_pool().submit(bind(visual_search), query, limit * 3, filters) if _clip_available else None
+    complete = True
+
+    with stage("expand"):
+        expanded = expand_query(query)
+    with stage("fts"):
+        text_results = text_search(expanded, limit=limit * 5, timeout=TEXT_BUDGET_MS / 1000,
+                                   filters=filters) if expanded else []
+    if expanded and not text_results and time.monotonic() - started >= TEXT_BUDGET_MS / 1000:
+        leg_timeouts["text"] += 1
+        complete = False
+
+    vis_results = []
+    if vis_future is not None:
+        remaining = VISUAL_BUDGET_MS / 1000 - (time.monotonic() - started)
+        try:
+            with stage("visual_wait"):
+                vis_results = vis_future.result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            # Degrade to text-only; the leg finishes in the background and
+            # its result is dropped (or it never starts, if still queued).
+            vis_future.cancel()
+            leg_timeouts["visual"] += 1
+            complete = False
+
+    return _fuse(text_results, vis_results, text_weight, visual_weight, limit, dedup) + (complete,)
+
+
+def _duplicate_groups():
+    """{item id: id of the item it duplicates}, loaded once per import."""
+    global _duplicates
+    if _duplicates is None:
+        _duplicates = get_duplicate_map()
+    return _duplicates
+
+
+def _fuse(text_results, vis_results, text_weight, visual_weight, limit, dedup=False):
+    """Normalize each leg's scores to 0..1 and blend them; returns
+    (ids best first, "hybrid" or "text")."""
     if not vis_results:
         text_weight = 1.0
         visual_weight = 0.0
@@ -230,26 +568,189 @@ def hybrid_search(query, text_weight=0.4, visual_weight=0.6, limit=60):
         final = text_weight * t_score + visual_weight * v_score
         combined.append((item_id, final))
 
-    combined.sort(key=lambda x: x[1], reverse=True)
-    top_ids = [c[0] for c in combined[:limit]]
+    # Ties break on id so every worker pages through the same order.
+    combined.sort(key=lambda x: (-x[1], x[0]))
+    ranked = [c[0] for c in combined]
+    if dedup:
+        duplicates = _duplicate_groups()
+        seen = set()
+        collapsed = []
+        for item_id in ranked:
+            group = duplicates.get(item_id, item_id)
+            if group not in seen:
+                seen.add(group)
+                collapsed.append(item_id)
+        ranked = collapsed
+    return ranked[:limit], "hybrid" if vis_results else "text"
+
+
+def hybrid_search(query, text_weight=0.4, visual_weight=0.6, limit=60, as_json=False, with_mode=False,
+                  filters=None, dedup=False):
+    """
+    The top `limit` items of rank_hybrid, restricted by attribute filters
+    ({name: (low, high)}, see database.filter_sql).
+    With as_json, items come back as ready-to-send JSON strings. With
+    with_mode, returns (items, mode) where mode says which searches ran:
+    "hybrid", "text" or "browse" (empty query).
+    """
+    if not query or not query.strip():
+        items = get_all_items(limit=limit, as_json=as_json, filters=filters, dedup=dedup)
+        return (items, "browse") if with_mode else items
 
-    items = get_items_by_ids(top_ids)
-    return items
+    top_ids, mode, _ = rank_hybrid(query, text_weight, visual_weight, limit, filters, dedup)
+    with stage("fetch"):
+        items = get_items_by_ids(top_ids, as_json=as_json)
+    return (items, mode) if with_mode else items
 
 
-def filter_by_category(category, limit=60):
-    from app.database import _connect
-    conn = _connect()
+def rank_hybrid_batch(queries, text_weight=0.4, visual_weight=0.6, limit=60, filters=None, dedup=False):
+    """rank_hybrid for many queries at once; a list of (ids, mode, complete).
+
+    The visual legs run as one visual_search_batch on the leg pool while
+    the text legs run one after another on this thread's connection. The
+    visual batch has to finish within VISUAL_BUDGET_MS plus
+    BATCH_VISUAL_MS_PER_QUERY per query, or by the time the text legs are
+    done if they took longer; otherwise every query is answered from text
+    alone.
+    """
+    started = time.monotonic()
+    vis_future = (_get_leg_pool().submit(bind(visual_search_batch), queries, limit * 3, filters)
+                  if _clip_available else None)
+
+    text_batch, text_complete = [], []
+    for query in queries:
+        leg_started = time.monotonic()
+        with stage("expand"):
+            expanded = expand_query(query)
+        with stage("fts"):
+            text_results = text_search(expanded, limit=limit * 5, timeout=TEXT_BUDGET_MS / 1000,
+                                       filters=filters) if expanded else []
+        timed_out = expanded and not text_results and time.monotonic() - leg_started >= TEXT_BUDGET_MS / 1000
+        if timed_out:
+            leg_timeouts["text"] += 1
+        text_batch.append(text_results)
+        text_complete.append(not timed_out)
+
+    vis_batch = [[] for _ in queries]
+    vis_complete = True
+    if vis_future is not None:
+        budget = (VISUAL_BUDGET_MS + BATCH_VISUAL_MS_PER_QUERY * len(queries)) / 1000
+        remaining = max(budget - (time.monotonic() - started), 0)
+        try:
+            with stage("visual_wait"):
+                vis_batch = vis_future.result(timeout=remaining)
+        except FutureTimeout:
+            vis_future.cancel()
+            leg_timeouts["visual"] += 1
+            vis_complete = False
+
+    return [_fuse(text_results, vis_results, text_weight, visual_weight, limit, dedup) + (complete and vis_complete,)
+            for text_results, vis_results, complete in zip(text_batch, vis_batch, text_complete)]
+
+
+def hybrid_search_batch(queries, text_weight=0.4, visual_weight=0.6, limit=60, as_json=False, filters=None,
+                        dedup=False):
+    """hybrid_search for a list of queries; returns [(items, mode), ...]."""
+    ranked = rank_hybrid_batch(queries, text_weight, visual_weight, limit, filters, dedup)
+    results = []
+    with stage("fetch"):
+        for top_ids, mode, _ in ranked:
+            results.append((get_items_by_ids(top_ids, as_json=as_json), mode))
+    return results
+
+
+def search_page(query, text_weight=0.4, visual_weight=0.6, offset=0, limit=60, as_json=False, filters=None,
+                dedup=False):
+    """One page of a query's ranking for cursor paging.
+
+    The ranking is computed once, MAX_RESULTS deep, and kept as an id array
+    for RANKING_TTL seconds, so each further page is a slice plus one row
+    fetch. A ranking degraded by a leg timeout is not kept. Returns (items,
+    mode, ranked, complete) where ranked is the ranking's length and
+    complete is rank_hybrid's flag (True for a kept ranking).
+    """
+    key = (" ".join(query.lower().split()), text_weight, visual_weight, search_mode(),
+           _filter_key(filters or {}), dedup)
+    now = time.monotonic()
+    with _rankings_lock:
+        entry = _rankings.get(key)
+        if entry is not None and now - entry[0] < RANKING_TTL:
+            _rankings.move_to_end(key)
+        else:
+            entry = None
+    complete = True
+    if entry is None:
+        ids, mode, complete = rank_hybrid(query, text_weight, visual_weight, MAX_RESULTS, filters, dedup)
+        entry = (now, np.array(ids, dtype=np.int64), mode)
+        if complete:
+            with _rankings_lock:
+                _rankings[key] = entry
+                while len(_rankings) > RANKING_CACHE_SIZE:
+                    _rankings.popitem(last=False)
+    _, ids, mode = entry
+    page = ids[offset:offset + limit].tolist()
+    with stage("fetch"):
+        return get_items_by_ids(page, as_json=as_json), mode, len(ids), complete
+
+
+def _position_of(item_id):
+    """Row of item_id in the embedding store, or None."""
+    global _id_order
+    ids = (_embedding_cache if _embedding_cache is not None else _load_embeddings())[0]
+    order = _id_order
+    if order is None:
+        order = _id_order = np.argsort(ids, kind="stable")
+    i = np.searchsorted(ids, item_id, sorter=order)
+    if i < ids.size and ids[order[i]] == item_id:
+        return int(order[i])
+    return None
+
+
+def similar_items(item_id, limit=12, as_json=False, filters=None):
+    """Items that look most like item_id, best first ([] if it has no
+    embedding). Served from the list import precomputed (database.get_neighbors)
+    when that is long enough. With filters, or for items added since,
+    the item's stored embedding is scored against the catalog instead;
+    no query encoding is needed either way."""
+    stored = None if filters else get_neighbors(item_id)
+    if stored is not None and len(stored[0]) >= limit:
+        top_ids = stored[0][:limit].tolist()
+    else:
+        position = _position_of(item_id)
+        if position is None:
+            return []
+        ids, matrix = _embedding_cache
+        mask = filter_mask(ids, filters) if filters else None
+        matching = int(np.count_nonzero(mask)) if mask is not None else ids.size
+        if matching == 0:
+            return []
+        query_vec = np.asarray(matrix[position], dtype=np.float32)
+        with stage("score"):
+            found = _score_visual(ids, matrix, mask, matching, query_vec, limit + 1)
+        top_ids = [i for i, _ in found if i != item_id][:limit]
+    with stage("fetch"):
+        return get_items_by_ids(top_ids, as_json=as_json)
+
+
+def filter_by_category(category, limit=60, as_json=False):
+    from app.database import _read_conn, ITEM_COLUMNS, ITEM_JSON
+    conn = _read_conn()
     rows = conn.execute(
-        "SELECT * FROM items WHERE category = ? ORDER BY name LIMIT ?",
+        f"SELECT {ITEM_JSON if as_json else ITEM_COLUMNS} FROM items "
+        f"WHERE category = ? ORDER BY name LIMIT ?",
         (category, limit),
     ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return [r[0] for r in rows] if as_json else [dict(r) for r in rows]
+
+
+def browse_all(limit=60, offset=0, as_json=False, filters=None, dedup=False):
+    return get_all_items(limit=limit, offset=offset, as_json=as_json, filters=filters, dedup=dedup)
 
 
-def browse_all(limit=60, offset=0):
-    return get_all_items(limit=limit, offset=offset)
+def browse_page(after=None, limit=60, as_json=False, filters=None, dedup=False):
+    """Keyset-paged browse; see database.get_items_page."""
+    with stage("fetch"):
+        return get_items_page(after=after, limit=limit, as_json=as_json, filters=filters, dedup=dedup)
 
 
 def list_categories():
@@ -1,11 +1,46 @@
+import os
+import re
 import json
-from flask import Flask, request, jsonify, send_from_directory
+import time
+import base64
+import threading
+from flask import Flask, Response, request, jsonify, send_from_directory, g, abort
+from werkzeug.wsgi import wrap_file
 from app.config import load_config
-from app.database import init_db, get_item_count
-from app.search import hybrid_search, filter_by_category, browse_all, list_categories
+from app import result_cache, database, metrics, text_cache
+from app.database import (
+    init_db, get_item_count, get_generation, get_items_by_ids, configure_attributes, parse_attribute,
+)
+from app.search import (
+    search_page, browse_page, hybrid_search_batch, similar_items, filter_by_category, browse_all, list_categories, invalidate_cache,
+    configure_ann, configure_rescore, configure_legs, configure_paging, search_mode, embedding_stats,
+    leg_timeouts,
+)
 
 cfg = load_config()
 app = Flask(__name__, static_folder=cfg["_static_dir"], static_url_path="/static")
+result_cache.configure(cfg["search"].get("result_cache_size", 512))
+configure_ann(**cfg["search"].get("ann", {}))
+configure_rescore(cfg["search"].get("rescore"))
+configure_legs(**cfg["search"].get("legs", {}))
+configure_paging(**cfg["search"].get("paging", {}))
+configure_attributes(cfg["columns"].get("attributes"))
+metrics.configure(cfg.get("server", {}).get("metrics", False))
+BATCH_MAX_QUERIES = cfg["search"].get("batch_max_queries", 100)
+DEDUP_DEFAULT = bool(cfg["search"].get("dedup", False))
+
+_seen_generation = None
+_thumb_manifest = None
+
+# Cleared by serve.py while the query encoder and embeddings load in the
+# background; until then searches are answered from text search alone.
+_warmup_done = threading.Event()
+_warmup_done.set()
+
+# Thumbnails named <source content hash>_<width>q<quality>.<ext> never change.
+_HASHED_THUMB = re.compile(r"^[0-9a-f]{16}_\d+q\d+\.(jpg|webp)$")
+_THUMB_TYPES = {".jpg": "image/jpeg", ".webp": "image/webp"}
+THUMB_MAX_AGE = 365 * 24 * 3600
 
 
 @app.before_request
@@ -13,6 +48,134 @@ def _strip():
     pass
 
 
+@app.before_request
+def _start_timers():
+    if metrics.enabled:
+        g.started = time.perf_counter()
+        metrics.start_request()
+
+
+@app.after_request
+def _report_timers(resp):
+    """Server-Timing header and request-duration histogram."""
+    if metrics.enabled and "started" in g:
+        timings = metrics.end_request()
+        total = time.perf_counter() - g.started
+        resp.headers["Server-Timing"] = metrics.server_timing(timings + [("total", total)])
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", route, total)
+    return resp
+
+
+def set_warming_up(warming):
+    if warming:
+        _warmup_done.clear()
+    else:
+        _warmup_done.set()
+
+
+def _items_body(items_json, **fields):
+    """JSON body around items already serialized by the database layer."""
+    body = '{"items":[' + ",".join(items_json) + "]"
+    for key, value in fields.items():
+        body += "," + json.dumps(key) + ":" + json.dumps(value)
+    return body + "}"
+
+
+def _encode_cursor(**state):
+    """Opaque, URL-safe page cursor."""
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(token):
+    """State dict from _encode_cursor; ValueError if the token is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(state, dict):
+        raise ValueError("invalid cursor")
+    return state
+
+
+def _parse_filters(args):
+    """Attribute filters from query parameters: ?<name>=v (equals),
+    ?<name>_min=v and ?<name>_max=v, for each configured attribute.
+    Returns {name: (low, high)}; ValueError names a bad parameter."""
+    filters = {}
+    for name, (_, kind) in database.ATTRIBUTES.items():
+        bounds = []
+        for param in (f"{name}_min", f"{name}_max"):
+            raw = args.get(param, args.get(name))
+            if raw is None or raw.strip() == "":
+                bounds.append(None)
+                continue
+            value = parse_attribute(raw, kind)
+            if value is None:
+                raise ValueError(f"invalid {param if param in args else name}: {raw!r}")
+            bounds.append(value)
+        if bounds != [None, None]:
+            filters[name] = tuple(bounds)
+    return filters
+
+
+def _int_param(args, name, default, minimum):
+    """Integer parameter `name` from args (request.args or a JSON body), at
+    least `minimum`; ValueError naming the parameter otherwise."""
+    value = args.get(name, default)
+    try:
+        number = int(value)
+    except (ValueError, TypeError):
+        number = None
+    if number is None or isinstance(value, bool) or number < minimum:
+        raise ValueError(f"{name} must be an integer >= {minimum}")
+    return number
+
+
+def _parse_dedup(value):
+    """?dedup=1/0 (or a JSON boolean), defaulting to search.dedup."""
+    if value is None or value == "":
+        return DEDUP_DEFAULT
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _current_generation():
+    """Database generation, dropping in-process caches when an import has run."""
+    global _seen_generation, _thumb_manifest
+    generation = get_generation()
+    if generation != _seen_generation:
+        if _seen_generation is not None:
+            invalidate_cache()
+            result_cache.clear()
+            _thumb_manifest = None
+        _seen_generation = generation
+    return generation
+
+
+def _cached_response(key, build):
+    """Serve a body from the result cache, with an ETag so repeat browser
+    requests can be answered with 304 Not Modified. build() returns
+    (body, cacheable); a body that isn't cacheable (a search degraded by a
+    leg timeout) is sent once and not stored."""
+    generation = _current_generation()
+    cached = result_cache.get(key, generation)
+    if cached is None:
+        with metrics.stage("build"):
+            body, cacheable = build()
+        if cacheable:
+            etag = result_cache.put(key, generation, body)
+        else:
+            etag = result_cache.etag(generation, body)
+    else:
+        body, etag = cached
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
 @app.route("/")
 def index():
     return send_from_directory(cfg["_static_dir"], "index.html")
@@ -25,30 +188,155 @@ def budget_builder():
 
 @app.route("/api/search")
 def api_search():
+    """Search (q) or browse (no q), optionally filtered on the configured
+    attributes (see _parse_filters). Responses carry a `next` cursor while
+    there are more results; pass it back as ?cursor= with the same q,
+    limit and filters for the following page."""
     query = request.args.get("q", "").strip()
-    limit = min(int(request.args.get("limit", cfg["search"]["results_per_page"])), 200)
-    offset = int(request.args.get("offset", 0))
+    cursor = request.args.get("cursor", "")
+    try:
+        limit = min(_int_param(request.args, "limit", cfg["search"]["results_per_page"], 1), 200)
+        offset = _int_param(request.args, "offset", 0, 0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        state = _decode_cursor(cursor) if cursor else {}
+        start = int(state.get("o", offset))
+        after = tuple(state["k"]) if "k" in state else None
+        if after is not None and len(after) != 2:
+            raise ValueError("invalid cursor")
+        if start < 0:
+            raise ValueError("invalid cursor")
+    except (ValueError, TypeError):
+        return jsonify({"error": "invalid cursor"}), 400
+    try:
+        filters = _parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     tw = cfg["search"]["text_weight"]
     vw = cfg["search"]["visual_weight"]
+    mode = search_mode() if query else "browse"
+    dedup = _parse_dedup(request.args.get("dedup"))
 
-    if query:
-        items = hybrid_search(query, text_weight=tw, visual_weight=vw, limit=limit)
-    else:
-        items = browse_all(limit=limit, offset=offset)
-
-    for item in items:
-        item.pop("embedding", None)
-        if item.get("extra_data"):
-            try:
-                item["extra"] = json.loads(item["extra_data"])
-            except (json.JSONDecodeError, TypeError):
-                item["extra"] = {}
+    def build():
+        complete = True
+        if query:
+            items, used, ranked, complete = search_page(query, tw, vw, offset=start, limit=limit, as_json=True,
+                                                        filters=filters, dedup=dedup)
+            next_cursor = _encode_cursor(o=start + limit) if start + limit < ranked else None
+        elif offset and not cursor:
+            items = browse_all(limit=limit, offset=offset, as_json=True, filters=filters, dedup=dedup)
+            used, next_cursor = "browse", None
         else:
-            item["extra"] = {}
-        item.pop("extra_data", None)
+            items, last = browse_page(after=after, limit=limit, as_json=True, filters=filters, dedup=dedup)
+            used, next_cursor = "browse", _encode_cursor(k=list(last)) if last else None
+        with metrics.stage("render"):
+            return _items_body(items, total=get_item_count(), mode=used, next=next_cursor), complete
+
+    # The mode is part of the key so text-only answers given during warmup
+    # aren't served once visual search is up.
+    key = result_cache.make_key("search", query, limit=limit, offset=offset, cursor=cursor, tw=tw, vw=vw,
+                                mode=mode, filters=tuple(sorted(filters.items())), dedup=dedup)
+    return _cached_response(key, build)
+
+
+@app.route("/api/search/batch", methods=["POST"])
+def api_search_batch():
+    """Many searches in one request, e.g. every line of a shopping list.
+    Body: {"queries": [...], "limit": n, "filters": {...}, "dedup": bool}
+    where filters takes the same keys as /api/search's query parameters. Returns
+    {"results": [{"query", "items", "mode"}, ...]} in query order."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "expected a JSON object"}), 400
+    queries = data.get("queries")
+    if (not isinstance(queries, list) or not queries
+            or not all(isinstance(q, str) and q.strip() for q in queries)):
+        return jsonify({"error": "queries must be a list of non-empty strings"}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"at most {BATCH_MAX_QUERIES} queries per batch"}), 400
+    try:
+        limit = min(_int_param(data, "limit", 10, 1), 200)
+        raw_filters = data.get("filters") or {}
+        filters = _parse_filters({k: str(v) for k, v in raw_filters.items()})
+        dedup = _parse_dedup(data.get("dedup"))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    queries = [q.strip() for q in queries]
+    _current_generation()
+    results = hybrid_search_batch(queries, cfg["search"]["text_weight"], cfg["search"]["visual_weight"],
+                                  limit=limit, as_json=True, filters=filters, dedup=dedup)
+    with metrics.stage("render"):
+        parts = [
+            '{"query":' + json.dumps(query) + ',"items":[' + ",".join(items) + '],"mode":' + json.dumps(mode) + "}"
+            for query, (items, mode) in zip(queries, results)
+        ]
+        body = '{"results":[' + ",".join(parts) + "]}"
+    return Response(body, mimetype="application/json")
+
+
+@app.route("/api/items/<int:item_id>/similar")
+def api_similar(item_id):
+    """Items that look like item_id ("more like this"), optionally
+    filtered like /api/search (e.g. ?owned_min=1 for alternatives in stock)."""
+    try:
+        limit = min(_int_param(request.args, "limit", 12, 1), 60)
+        filters = _parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not get_items_by_ids([item_id]):
+        return jsonify({"error": "no such item"}), 404
 
-    return jsonify({"items": items, "total": get_item_count()})
+    def build():
+        return _items_body(similar_items(item_id, limit=limit, as_json=True, filters=filters)), True
+
+    key = result_cache.make_key("similar", item_id=item_id, limit=limit, filters=tuple(sorted(filters.items())))
+    return _cached_response(key, build)
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 503 until background warmup has finished."""
+    ready = _warmup_done.is_set()
+    body = {"ready": ready, "mode": search_mode(), "items": get_item_count()}
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Stage and request latency histograms, cache hit counts and embedding
+    store size, in Prometheus text format (404 unless server.metrics)."""
+    if not metrics.enabled:
+        abort(404)
+    rows, size = embedding_stats()
+    body = metrics.render([
+        ("result_cache_hits_total", "API responses served from the result cache.", "counter",
+         {"": result_cache.hits}),
+        ("result_cache_misses_total", "API responses that had to be built.", "counter",
+         {"": result_cache.misses}),
+        ("text_cache_hits_total", "Query encodings found in the in-process LRU.", "counter",
+         {"": text_cache.hits}),
+        ("text_cache_misses_total", "Query encodings read from disk or computed.", "counter",
+         {"": text_cache.misses}),
+        ("search_leg_timeouts_total", "Search legs dropped for missing their budget.", "counter",
+         {f'leg="{leg}"': n for leg, n in leg_timeouts.items()}),
+        ("embedding_matrix_rows", "Rows in the loaded embedding store.", "gauge", {"": rows}),
+        ("embedding_matrix_bytes", "Size of the loaded embedding store, including any quantized copy.",
+         "gauge", {"": size}),
+        ("catalog_items", "Items in the database.", "gauge", {"": get_item_count()}),
+        ("search_visual_enabled", "1 once visual search is serving.", "gauge",
+         {"": int(search_mode() == "hybrid")}),
+    ])
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/api/categories")
@@ -59,23 +347,47 @@ def api_categories():
 @app.route("/api/category/<category>")
 def api_category(category):
     limit = min(int(request.args.get("limit", 60)), 200)
-    items = filter_by_category(category, limit=limit)
-    for item in items:
-        item.pop("embedding", None)
-        if item.get("extra_data"):
+    def build():
+        return _items_body(filter_by_category(category, limit=limit, as_json=True)), True
+
+    return _cached_response(result_cache.make_key("category", category=category, limit=limit), build)
+
+
+def _get_thumb_manifest():
+    """{file name: size} written by import_data.py, or {} if disabled/missing."""
+    global _thumb_manifest
+    if _thumb_manifest is None:
+        _thumb_manifest = {}
+        if cfg.get("thumbnails", {}).get("manifest", True):
             try:
-                item["extra"] = json.loads(item["extra_data"])
-            except (json.JSONDecodeError, TypeError):
-                item["extra"] = {}
-        else:
-            item["extra"] = {}
-        item.pop("extra_data", None)
-    return jsonify({"items": items})
+                with open(cfg["_thumb_manifest"], "r", encoding="utf-8") as f:
+                    _thumb_manifest = json.load(f)
+            except (OSError, ValueError):
+                pass
+    return _thumb_manifest
 
 
 @app.route("/thumbnails/<path:filename>")
 def serve_thumbnail(filename):
-    return send_from_directory(cfg["_thumb_dir"], filename)
+    size = _get_thumb_manifest().get(filename)
+    resp = None
+    if size is not None:
+        # Known from the manifest: open it directly instead of stat-ing first.
+        try:
+            f = open(os.path.join(cfg["_thumb_dir"], filename), "rb")
+        except OSError:
+            pass
+        else:
+            mimetype = _THUMB_TYPES.get(os.path.splitext(filename)[1].lower(), "application/octet-stream")
+            resp = Response(wrap_file(request.environ, f), mimetype=mimetype, direct_passthrough=True)
+            resp.content_length = size
+    if resp is None:
+        resp = send_from_directory(cfg["_thumb_dir"], filename)
+    if _HASHED_THUMB.match(filename):
+        resp.cache_control.public = True
+        resp.cache_control.max_age = THUMB_MAX_AGE
+        resp.cache_control.immutable = True
+    return resp
 
 
 def create_app():
@@ -0,0 +1,244 @@
+"""
+Cache of CLIP text-query embeddings.
+
+A bounded in-process LRU sits in front of the query encoder (the exported
+text_encoder or clip_engine, see set_encoder), backed by
+a small SQLite file (data/query_cache.db) so encodings survive restarts and
+are shared between gunicorn workers. The disk table also counts how often
+each query is asked, which is what warmup() uses to pick queries to preload.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_FILE = "query_cache.db"
+_HIT_FLUSH_EVERY = 50
+
+_lru = OrderedDict()
+_max_entries = 1024
+_db_path = None
+_pending_hits = {}
+_lock = threading.Lock()
+_encode = None
+_encode_batch = None
+_model_tag = None
+hits = 0
+misses = 0
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query.lower()).strip()
+
+
+def set_encoder(encode_fn, model_tag, encode_batch=None):
+    """Use encode_fn for cache misses; model_tag keys its disk entries.
+    encode_batch, if given, encodes a list of queries in one pass."""
+    global _encode, _encode_batch, _model_tag
+    _encode, _encode_batch, _model_tag = encode_fn, encode_batch, model_tag
+
+
+def _encoder():
+    if _encode is None:
+        from app.clip_engine import encode_text, encode_texts, MODEL_TAG
+        set_encoder(encode_text, MODEL_TAG, encode_texts)
+    return _encode
+
+
+def _connect():
+    conn = sqlite3.connect(_db_path, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def init_text_cache(db_path, max_entries=1024):
+    """Point the persistent cache at the data directory next to db_path.
+    Without this call the cache is in-memory only."""
+    global _db_path, _max_entries
+    _max_entries = max_entries
+    _db_path = os.path.join(os.path.dirname(db_path), CACHE_FILE)
+    conn = _connect()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS text_embeddings (
+            model       TEXT NOT NULL,
+            query       TEXT NOT NULL,
+            embedding   BLOB NOT NULL,
+            hits        INTEGER DEFAULT 0,
+            PRIMARY KEY (model, query)
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+
+def _remember(key, vec):
+    _lru[key] = vec
+    _lru.move_to_end(key)
+    while len(_lru) > _max_entries:
+        _lru.popitem(last=False)
+
+
+def _disk_get(key):
+    if _db_path is None:
+        return None
+    conn = _connect()
+    row = conn.execute(
+        "SELECT embedding FROM text_embeddings WHERE model = ? AND query = ?",
+        (_model_tag, key),
+    ).fetchone()
+    conn.close()
+    return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+
+def _disk_put(items):
+    if _db_path is None or not items:
+        return
+    conn = _connect()
+    conn.executemany(
+        "INSERT OR IGNORE INTO text_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+        [(_model_tag, key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _count_hit(key):
+    """Buffer one hit for key; call with _lock held. Returns the buffered
+    counts once there are enough to write, for the caller to pass to
+    _write_hits after releasing the lock."""
+    global _pending_hits
+    _pending_hits[key] = _pending_hits.get(key, 0) + 1
+    if sum(_pending_hits.values()) < _HIT_FLUSH_EVERY:
+        return None
+    pending, _pending_hits = _pending_hits, {}
+    return pending
+
+
+def _write_hits(pending):
+    if _db_path is None or not pending:
+        return
+    conn = _connect()
+    conn.executemany(
+        "UPDATE text_embeddings SET hits = hits + ? WHERE model = ? AND query = ?",
+        [(n, _model_tag, key) for key, n in pending.items()],
+    )
+    conn.commit()
+    conn.close()
+
+
+def flush_hits():
+    """Write buffered per-query hit counts to disk."""
+    global _pending_hits
+    with _lock:
+        pending, _pending_hits = _pending_hits, {}
+    _write_hits(pending)
+
+
+def cached_encode_text(query):
+    """encode_text with an LRU + on-disk cache keyed on the normalized query."""
+    global hits, misses
+    key = normalize_query(query)
+    with _lock:
+        vec = _lru.get(key)
+        if vec is not None:
+            _lru.move_to_end(key)
+            pending = _count_hit(key)
+            hits += 1
+        else:
+            misses += 1
+    if vec is not None:
+        _write_hits(pending)
+        return vec
+
+    encode = _encoder()
+    vec = _disk_get(key)
+    if vec is None:
+        vec = np.asarray(encode(key), dtype=np.float32)
+        _disk_put([(key, vec)])
+
+    with _lock:
+        _remember(key, vec)
+        pending = _count_hit(key)
+    _write_hits(pending)
+    return vec
+
+
+def cached_encode_texts(queries):
+    """cached_encode_text for many queries: an (n, dim) array. Cache misses
+    are encoded together, in one forward pass when the encoder has a
+    batch function."""
+    global hits, misses
+    keys = [normalize_query(q) for q in queries]
+    found = {}
+    flush = {}
+    with _lock:
+        for key in keys:
+            vec = _lru.get(key)
+            if vec is not None:
+                _lru.move_to_end(key)
+                found[key] = vec
+                hits += 1
+            for k, n in (_count_hit(key) or {}).items():
+                flush[k] = flush.get(k, 0) + n
+        misses += len(set(keys) - found.keys())
+
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    encode = _encoder()
+    to_encode = []
+    for key in missing:
+        vec = _disk_get(key)
+        if vec is None:
+            to_encode.append(key)
+        else:
+            found[key] = vec
+    if to_encode:
+        if _encode_batch is not None:
+            vecs = np.asarray(_encode_batch(to_encode), dtype=np.float32)
+        else:
+            vecs = [np.asarray(encode(key), dtype=np.float32) for key in to_encode]
+        encoded = list(zip(to_encode, vecs))
+        _disk_put(encoded)
+        found.update(encoded)
+
+    with _lock:
+        for key in missing:
+            _remember(key, found[key])
+    # After _disk_put, so hits on newly encoded queries have a row to count in.
+    _write_hits(flush)
+    return np.stack([found[key] for key in keys])
+
+
+def warmup(words, top_queries=200):
+    """Preload the LRU with the most-asked queries from disk, then with
+    `words`, encoding any that aren't on disk yet."""
+    encode = _encoder()
+    loaded = 0
+    if _db_path is not None and top_queries > 0:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT query, embedding FROM text_embeddings WHERE model = ? "
+            "ORDER BY hits DESC LIMIT ?",
+            (_model_tag, min(top_queries, _max_entries)),
+        ).fetchall()
+        conn.close()
+        with _lock:
+            for key, blob in reversed(rows):
+                _remember(key, np.frombuffer(blob, dtype=np.float32))
+        loaded = len(rows)
+
+    encoded = []
+    for word in sorted({normalize_query(w) for w in words}):
+        if word in _lru:
+            continue
+        vec = _disk_get(word)
+        if vec is None:
+            vec = np.asarray(encode(word), dtype=np.float32)
+            encoded.append((word, vec))
+        with _lock:
+            _remember(word, vec)
+    _disk_put(encoded)
+    return loaded, len(encoded)
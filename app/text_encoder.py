@@ -0,0 +1,211 @@
+"""
+Torch-free CLIP text encoder for the serving path.
+
+export_text_encoder.py writes just the text tower of the CLIP model
+(data/clip_text/: one .npy per weight, the BPE vocabulary and meta.json).
+This module tokenizes and runs that transformer in numpy, so the web
+process never imports torch or open_clip and never builds the image tower.
+Weights are memory-mapped, so gunicorn workers share one copy through the
+OS page cache.
+
+Output matches clip_engine.encode_text to float32 rounding.
+"""
+
+import os
+import gzip
+import html
+import json
+import math
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    import regex as re
+    _TOKEN_PATTERN = r"""<start_of_text>|<end_of_text>|'s|'t|'re|'ve|'m|'ll|'d|[\p{L}]+|[\p{N}]|[^\s\p{L}\p{N}]+"""
+except ImportError:
+    # Without the regex package, approximate the Unicode letter/number
+    # classes with re's \w; identical for ASCII queries.
+    import re
+    _TOKEN_PATTERN = r"""<start_of_text>|<end_of_text>|'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|(?:[^\s\w]|_)+"""
+
+try:
+    import ftfy
+except ImportError:
+    ftfy = None
+
+ARTIFACT_DIR = "clip_text"
+META_FILE = "meta.json"
+VOCAB_FILE = "bpe_simple_vocab_16e6.txt.gz"
+
+_meta = None
+_weights = None
+_encoder = None
+_bpe_ranks = None
+_byte_encoder = None
+_pattern = None
+
+
+def artifact_dir(db_path):
+    return os.path.join(os.path.dirname(db_path), ARTIFACT_DIR)
+
+
+def available(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+@lru_cache()
+def bytes_to_unicode():
+    """CLIP's reversible map from utf-8 bytes to printable unicode characters."""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(2 ** 8):
+        if b not in bs:
+            bs.append(b)
+            cs.append(2 ** 8 + n)
+            n += 1
+    return dict(zip(bs, [chr(c) for c in cs]))
+
+
+def _load_vocab(vocab_path):
+    global _encoder, _bpe_ranks, _byte_encoder, _pattern
+    merges = gzip.open(vocab_path).read().decode("utf-8").split("\n")
+    merges = [tuple(m.split()) for m in merges[1:49152 - 256 - 2 + 1]]
+    vocab = list(bytes_to_unicode().values())
+    vocab = vocab + [v + "</w>" for v in vocab]
+    vocab.extend("".join(m) for m in merges)
+    vocab.extend(["<start_of_text>", "<end_of_text>"])
+    _encoder = {v: i for i, v in enumerate(vocab)}
+    _bpe_ranks = {m: i for i, m in enumerate(merges)}
+    _byte_encoder = bytes_to_unicode()
+    _pattern = re.compile(_TOKEN_PATTERN, re.IGNORECASE)
+
+
+@lru_cache(maxsize=10000)
+def _bpe(token):
+    word = tuple(token[:-1]) + (token[-1] + "</w>",)
+    if len(word) == 1:
+        return word
+    while True:
+        pairs = {(a, b) for a, b in zip(word, word[1:])}
+        bigram = min(pairs, key=lambda p: _bpe_ranks.get(p, math.inf))
+        if bigram not in _bpe_ranks:
+            return word
+        first, second = bigram
+        merged = []
+        i = 0
+        while i < len(word):
+            if i < len(word) - 1 and word[i] == first and word[i + 1] == second:
+                merged.append(first + second)
+                i += 2
+            else:
+                merged.append(word[i])
+                i += 1
+        word = tuple(merged)
+        if len(word) == 1:
+            return word
+
+
+def tokenize(text):
+    """Token ids for one query: start token, BPE tokens, end token,
+    truncated to the model's context length."""
+    if ftfy is not None:
+        text = ftfy.fix_text(text)
+    text = " ".join(html.unescape(html.unescape(text)).split()).lower()
+    ids = [_encoder["<start_of_text>"]]
+    for token in _pattern.findall(text):
+        if token in ("<start_of_text>", "<end_of_text>"):
+            ids.append(_encoder[token])
+            continue
+        token = "".join(_byte_encoder[b] for b in token.encode("utf-8"))
+        ids.extend(_encoder[t] for t in _bpe(token))
+    ids = ids[:_meta["context_length"] - 1]
+    ids.append(_encoder["<end_of_text>"])
+    return ids
+
+
+def load_text_encoder(path):
+    """Load an exported text tower; its model tag (for caches) is returned."""
+    global _meta, _weights
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    weights = {}
+    for name in meta["weights"]:
+        weights[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+    _load_vocab(os.path.join(path, VOCAB_FILE))
+    _bpe.cache_clear()
+    _meta, _weights = meta, weights
+    return meta["model"]
+
+
+def _layer_norm(x, prefix):
+    mu = x.mean(axis=-1, keepdims=True)
+    var = np.square(x - mu).mean(axis=-1, keepdims=True)
+    return (x - mu) / np.sqrt(var + 1e-5) * _weights[prefix + ".weight"] + _weights[prefix + ".bias"]
+
+
+def _erf(x):
+    # Abramowitz & Stegun 7.1.26, |error| < 1.5e-7.
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    y = 1.0 - (((((1.061405429 * t - 1.453152027) * t) + 1.421413741) * t - 0.284496736) * t + 0.254829592) * t * np.exp(-x * x)
+    return sign * y
+
+
+def _gelu(x):
+    if _meta["activation"] == "quick_gelu":
+        return x / (1.0 + np.exp(-1.702 * x))
+    return 0.5 * x * (1.0 + _erf(x / math.sqrt(2.0)))
+
+
+def _block(x, prefix, mask):
+    w = _weights
+    heads = _meta["heads"]
+    b, n, width = x.shape
+    head_dim = width // heads
+
+    h = _layer_norm(x, prefix + ".ln_1")
+    qkv = h @ w[prefix + ".attn.in_proj_weight"] + w[prefix + ".attn.in_proj_bias"]
+    q, k, v = (qkv[..., i * width:(i + 1) * width].reshape(b, n, heads, head_dim).transpose(0, 2, 1, 3)
+               for i in range(3))
+    att = (q @ k.transpose(0, 1, 3, 2)) / math.sqrt(head_dim) + mask
+    att = np.exp(att - att.max(axis=-1, keepdims=True))
+    att /= att.sum(axis=-1, keepdims=True)
+    out = (att @ v).transpose(0, 2, 1, 3).reshape(b, n, width)
+    x = x + out @ w[prefix + ".attn.out_proj.weight"] + w[prefix + ".attn.out_proj.bias"]
+
+    h = _layer_norm(x, prefix + ".ln_2")
+    h = _gelu(h @ w[prefix + ".mlp.c_fc.weight"] + w[prefix + ".mlp.c_fc.bias"])
+    return x + h @ w[prefix + ".mlp.c_proj.weight"] + w[prefix + ".mlp.c_proj.bias"]
+
+
+def encode_texts(texts):
+    """Encode several queries in one forward pass; returns an (n, dim) array
+    of normalized embeddings."""
+    end = _encoder["<end_of_text>"]
+    # The model pools at the (first) end token and its attention mask is
+    # causal, so nothing after that token -- including the padding the
+    # torch model runs over -- can affect the output: skip it, and pad
+    # shorter queries in the batch only up to the longest one.
+    seqs = []
+    for text in texts:
+        ids = tokenize(text)
+        seqs.append(ids[:ids.index(end) + 1])
+    n = max(len(ids) for ids in seqs)
+    tokens = np.zeros((len(seqs), n), dtype=np.int64)
+    for i, ids in enumerate(seqs):
+        tokens[i, :len(ids)] = ids
+    x = (_weights["token_embedding.weight"][tokens] + _weights["positional_embedding"][:n]).astype(np.float32)
+    mask = np.triu(np.full((n, n), -np.inf, dtype=np.float32), 1)
+    for i in range(_meta["layers"]):
+        x = _block(x, f"transformer.resblocks.{i}", mask)
+    pooled = x[np.arange(len(seqs)), [len(ids) - 1 for ids in seqs]]
+    x = _layer_norm(pooled, "ln_final") @ _weights["text_projection"]
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def encode_text(text):
+    """Encode a text query into a normalized embedding vector."""
+    return encode_texts([text])[0]
@@ -0,0 +1,76 @@
+"""
+Recall and latency of the IVF index against exact visual search.
+
+Synthetic embeddings are drawn around random "concept" directions so they
+cluster roughly like real CLIP image embeddings; queries are noisy copies
+of concept directions.
+
+Usage:
+    python benchmarks/bench_ann_recall.py
+    python benchmarks/bench_ann_recall.py --items 200000 --nprobe 4 8 16 32 64
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.ann_index import build_ivf, probe
+from app.search import top_k
+
+DIM = 512
+
+
+def clustered_unit(n, dim, concepts, spread, rng):
+    centers = rng.standard_normal((concepts, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    m = centers[rng.integers(0, concepts, n)] + spread * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    m /= np.linalg.norm(m, axis=1, keepdims=True)
+    return m.astype(np.float32), centers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall vs exact search")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=180, help="top-k (hybrid_search asks for limit*3)")
+    parser.add_argument("--concepts", type=int, default=1000, help="synthetic clusters; more = harder for IVF")
+    parser.add_argument("--n-lists", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix, centers = clustered_unit(args.items, DIM, args.concepts, 1.5, rng)
+    ids = np.arange(1, args.items + 1, dtype=np.int64)
+    queries, _ = clustered_unit(args.queries, DIM, 1, 0.0, rng)
+    queries = centers[rng.integers(0, len(centers), args.queries)] + 0.8 * queries
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    t0 = time.perf_counter()
+    index, order = build_ivf(ids, matrix, n_lists=args.n_lists or None)
+    matrix = np.ascontiguousarray(matrix[order])
+    print(f"{args.items} items, {index['centroids'].shape[0]} lists, built in {time.perf_counter() - t0:.1f}s")
+
+    exact, exact_ms = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        exact.append(set(top_k(matrix @ q, args.limit).tolist()))
+        exact_ms.append((time.perf_counter() - t0) * 1000)
+    print(f"  exact          : p50 {np.median(exact_ms):7.2f} ms   recall@{args.limit} 1.000")
+
+    for nprobe in args.nprobe:
+        recalls, times = [], []
+        for q, truth in zip(queries, exact):
+            t0 = time.perf_counter()
+            positions, scores = probe(index, matrix, q, nprobe)
+            found = positions[top_k(scores, args.limit)]
+            times.append((time.perf_counter() - t0) * 1000)
+            recalls.append(len(truth.intersection(found.tolist())) / len(truth))
+        print(f"  nprobe {nprobe:<7} : p50 {np.median(times):7.2f} ms   recall@{args.limit} {np.mean(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    main()
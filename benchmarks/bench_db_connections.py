@@ -0,0 +1,88 @@
+"""
+Benchmark the serving-path database calls with a fresh connection per call
+(the old behaviour) vs. the reused per-thread read connection.
+
+Builds a throwaway database of synthetic items in a temp directory.
+
+Usage:
+    python benchmarks/bench_db_connections.py
+    python benchmarks/bench_db_connections.py --items 20000 --requests 500
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import database
+from app.search import expand_query, _SYNONYM_GROUPS
+
+QUERIES = ["gold charger", "chiavari chair", "blue furniture", "led sign", "rustic wood table"]
+
+
+def build_db(db_path, n, rng):
+    vocab = sorted({w for group in _SYNONYM_GROUPS for w in group})
+    database.init_db(db_path)
+    rows = (
+        (" ".join(rng.choice(vocab) for _ in range(4)), "", "", "", "", None, None, None, None, "")
+        for _ in range(n)
+    )
+    database.bulk_insert_items(rows)
+
+
+def one_request(query):
+    """The database work done by one /api/search call."""
+    hits = database.text_search(expand_query(query), limit=300)
+    database.get_items_by_ids([h[0] for h in hits[:60]])
+    database.get_item_count()
+
+
+def lookups_only(query):
+    """The same request without the FTS match, which otherwise dominates."""
+    database.get_items_by_ids(list(range(1, 61)))
+    database.get_item_count()
+    database.get_categories()
+
+
+def run(requests, fn=one_request):
+    times = []
+    for i in range(requests):
+        t0 = time.perf_counter()
+        fn(QUERIES[i % len(QUERIES)])
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000
+    return np.percentile(times, 50), np.percentile(times, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call vs reused SQLite connections")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_db(os.path.join(tmp, "inventory.db"), args.items, random.Random(0))
+
+        reused = database._read_conn
+        database._read_conn = database._connect
+        run(20)
+        before = run(args.requests), run(args.requests, lookups_only)
+        database._read_conn = reused
+        run(20)
+        after = run(args.requests), run(args.requests, lookups_only)
+        database.close_read_conn()
+
+    print(f"{args.items} items, {args.requests} requests (ms per request)")
+    for label, idx in (("full request", 0), ("lookups only", 1)):
+        print(f"  {label}")
+        print(f"    connection per call : p50 {before[idx][0]:.3f}  p95 {before[idx][1]:.3f}")
+        print(f"    reused read conn    : p50 {after[idx][0]:.3f}  p95 {after[idx][1]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Latency, memory and recall of the int8 embedding store against the
+float32 scan, with the coarse candidates re-scored at full precision the
+way visual_search does it.
+
+Usage:
+    python benchmarks/bench_quantized.py
+    python benchmarks/bench_quantized.py --items 200000 --rescore 0 180 300 1000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.embedding_store import quantize, score_rows
+from app.search import top_k
+from bench_ann_recall import clustered_unit, DIM
+
+
+def search(matrix, rows, scales, q, limit, rescore):
+    scores = score_rows(rows, scales, q)
+    if rows is matrix or not rescore:
+        return top_k(scores, limit)
+    cand = np.sort(top_k(scores, max(limit, rescore)))
+    return cand[top_k(matrix[cand] @ q, limit)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized embedding stores")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=180, help="top-k (hybrid_search asks for limit*3)")
+    parser.add_argument("--concepts", type=int, default=1000)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 300, 1000],
+                        help="candidates re-scored in float32 (0 = coarse ranking only)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix, centers = clustered_unit(args.items, DIM, args.concepts, 1.5, rng)
+    noise, _ = clustered_unit(args.queries, DIM, 1, 0.0, rng)
+    queries = centers[rng.integers(0, len(centers), args.queries)] + 0.8 * noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    truth = [set(top_k(matrix @ q, args.limit).tolist()) for q in queries]
+
+    stores = [("float32", matrix, None)]
+    for dtype in ("int8",):
+        stores.append((dtype,) + quantize(matrix, dtype))
+
+    print(f"{args.items} items, top {args.limit}")
+    print(f"{'store':>8} {'MB':>7} {'rescore':>8} {'p50 ms':>8} {'recall':>7}")
+    for dtype, rows, scales in stores:
+        mb = (rows.nbytes + (scales.nbytes if scales is not None else 0)) / 2**20
+        for rescore in ([0] if rows is matrix else args.rescore):
+            times, recalls = [], []
+            for q, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                found = search(matrix, rows, scales, q, args.limit, rescore)
+                times.append((time.perf_counter() - t0) * 1000)
+                recalls.append(len(expected.intersection(found.tolist())) / len(expected))
+            print(f"{dtype:>8} {mb:>7.1f} {rescore:>8} {np.median(times):>8.2f} {np.mean(recalls):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
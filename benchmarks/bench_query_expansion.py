@@ -0,0 +1,140 @@
+"""
+Latency of synonym-expanded FTS5 queries: the previous expansion (every
+synonym as a prefix query, no prefix index) against the current one
+(prefix index, synonyms resolved against the index vocabulary).
+
+Builds two throwaway databases from a synthetic catalog, so no spreadsheet
+is needed.
+
+Usage:
+    python benchmarks/bench_query_expansion.py
+    python benchmarks/bench_query_expansion.py --items 100000 --repeat 50
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import database, search
+
+QUERIES = [
+    "chair", "gold chair", "blue furniture", "white drape", "christmas tree", "rustic wood table",
+    "led sign", "velvet sofas", "ch", "zebra print",
+]
+
+
+def legacy_expand(query):
+    """expand_query as it was: every term plus its prefix, nothing pruned."""
+    terms = set()
+    for word in query.lower().split():
+        terms.add(word)
+        terms.add(word + "*")
+        for key in (word, word[:-1] if word.endswith("s") else None, word + "s"):
+            for syn in search.SYNONYMS.get(key, ()):
+                terms.add(syn)
+                terms.add(syn + "*")
+    clean = set()
+    for t in terms:
+        if t.endswith("*"):
+            if t[:-1] not in terms:
+                clean.add(t)
+        else:
+            clean.add(t)
+            clean.add(t + "*")
+    return " OR ".join(sorted(clean))
+
+
+def make_catalog(n, rng):
+    common = sorted({w for w in search.SYNONYMS if w.isalpha()})
+    common = [w for w in common if rng.random() < 0.5]
+    filler = ["".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz"), rng.integers(4, 9))) for _ in range(3000)]
+    makers = ["Acme", "Evergreen Rentals", "Bright Events", "Classic Party"]
+    for i in range(n):
+        words = list(rng.choice(common, 2)) + list(rng.choice(filler, 2))
+        yield (
+            " ".join(words).title(),
+            str(rng.choice(["Furniture", "Lighting", "Linens", "Decor", "Tabletop"])),
+            f'{{"Manufacturer": "{rng.choice(makers)}", "Part #": "P{rng.integers(100000, 999999)}"}}',
+            "", "", None, f"k{i}", None, None, "",
+        )
+
+
+def build_db(path, rows, legacy):
+    database.init_db(path)
+    database.bulk_insert_items(rows)
+    if legacy:
+        conn = sqlite3.connect(path)
+        conn.execute("DROP TABLE items_fts")
+        conn.execute("CREATE VIRTUAL TABLE items_fts USING fts5(name, category, extra_data, "
+                     "content='items', content_rowid='id')")
+        conn.execute("INSERT INTO items_fts(items_fts) VALUES('rebuild')")
+        conn.commit()
+        conn.close()
+
+
+def use_db(path):
+    database.DB_PATH = path
+    search.invalidate_cache()
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times)), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark expanded FTS5 queries")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=300, help="rows per query (hybrid_search asks for limit*5)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db, current_db = os.path.join(tmp, "legacy.db"), os.path.join(tmp, "current.db")
+        print(f"Building two {args.items}-item catalogs...")
+        build_db(legacy_db, make_catalog(args.items, np.random.default_rng(0)), legacy=True)
+        build_db(current_db, make_catalog(args.items, np.random.default_rng(0)), legacy=False)
+        run(args, legacy_db, current_db)
+        database.close_read_conn()
+
+
+def run(args, legacy_db, current_db):
+    print(f"{'query':<20} {'terms':>11} {'expand us':>10} {'before ms':>10} {'after ms':>9} {'same rows':>10}")
+    totals = [0.0, 0.0]
+    for query in QUERIES:
+        use_db(legacy_db)
+        old_terms = legacy_expand(query)
+        old_ms, _ = timeit(lambda: database.text_search(old_terms, args.limit), args.repeat)
+
+        use_db(current_db)
+        search.expand_query(query)  # first call loads the vocabulary
+        search._expand_word.cache_clear()
+        t0 = time.perf_counter()
+        new_terms = search.expand_query(query)
+        expand_us = (time.perf_counter() - t0) * 1e6
+        new_ms, _ = timeit(lambda: database.text_search(new_terms, args.limit) if new_terms else [],
+                                  args.repeat)
+
+        full_old = {r for r, _ in database.text_search(old_terms, 10 ** 9)}
+        full_new = {r for r, _ in database.text_search(new_terms, 10 ** 9)} if new_terms else set()
+        n_old = len(old_terms.split(" OR "))
+        n_new = len(new_terms.split(" OR ")) if new_terms else 0
+        totals[0] += old_ms
+        totals[1] += new_ms
+        print(f"{query:<20} {n_old:>5}->{n_new:<5} {expand_us:>10.0f} {old_ms:>10.2f} {new_ms:>9.2f} "
+              f"{'yes' if full_old == full_new else f'{len(full_old ^ full_new)} differ':>10}")
+    print(f"{'total':<20} {'':>11} {'':>10} {totals[0]:>10.2f} {totals[1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+End-to-end search benchmarks on synthetic catalogs, reported as JSON.
+
+For each catalog size this builds a throwaway database through
+app.database, timing the import stages. Item names are drawn from the
+synonym vocabulary and embeddings are random unit-norm vectors. It then
+measures p50/p95/p99 latency and throughput of text_search, visual_search,
+hybrid_search and the Flask /api/search endpoint.
+
+The CLIP query encoder is replaced by a deterministic stub (a unit vector
+seeded from the query text), so neither the spreadsheet nor the model is
+needed and the numbers don't include model time. Every query is distinct,
+so result caches don't flatter the figures.
+
+Usage:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --items 1000 10000 --queries 100 --json results.json
+    python benchmarks/bench_suite.py --json -          (JSON on stdout only)
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import sqlite3
+import hashlib
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import database
+
+DIM = 512
+STUB_TAG = "bench-stub"
+CATEGORIES = ["Furniture", "Lighting", "Linens", "Decor", "Tabletop", "Staging"]
+
+
+def stub_encode_text(text):
+    """Deterministic stand-in for clip_engine.encode_text."""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def stub_encode_texts(texts):
+    return np.stack([stub_encode_text(t) for t in texts])
+
+
+def install_stub_encoder():
+    """Make app.clip_engine (and so every query encoding) the stub, before
+    anything imports the real module and torch."""
+    stub = types.ModuleType("app.clip_engine")
+    stub.MODEL_TAG = STUB_TAG
+    stub.encode_text = stub_encode_text
+    stub.encode_texts = stub_encode_texts
+    sys.modules["app.clip_engine"] = stub
+    from app import text_cache
+    text_cache.set_encoder(stub_encode_text, STUB_TAG, stub_encode_texts)
+
+
+def vocabulary():
+    from app.search import _SYNONYM_GROUPS
+    return sorted({word for group in _SYNONYM_GROUPS for phrase in group for word in phrase.split()})
+
+
+def make_rows(n, rng, vocab):
+    for start in range(0, n, 1000):
+        block = rng.standard_normal((min(1000, n - start), DIM)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        for j, emb in enumerate(block):
+            i = start + j
+            extra = {
+                "Manufacturer": f"Maker {i % 40}",
+                "Part #": f"P{100000 + i}",
+                "Price": f"${rng.integers(1, 50000) / 100:,.2f}",
+                "Owned": str(int(rng.integers(0, 50))),
+                "Rented": str(int(rng.integers(0, 50))),
+                "Is Package": "Yes" if i % 9 == 0 else "No",
+            }
+            name = " ".join(rng.choice(vocab, 3)).title()
+            yield (name, CATEGORIES[i % len(CATEGORIES)], json.dumps(extra), "", "", emb,
+                   f"k{i}", None, None, "")
+
+
+def make_queries(n, rng, vocab):
+    queries = []
+    seen = set()
+    while len(queries) < n:
+        q = " ".join(rng.choice(vocab, int(rng.integers(1, 4))))
+        if q not in seen:
+            seen.add(q)
+            queries.append(q)
+    return queries
+
+
+def build_catalog(db_path, n, rng, vocab, cfg):
+    """The import_data.py pipeline minus spreadsheet, images and CLIP;
+    returns {stage: seconds}."""
+    from app.ann_index import build_ivf, save_ivf, remove_ivf
+    from app.embedding_store import write_store
+    from app import search
+
+    stages = {}
+
+    def stage(name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        stages[name] = round(time.perf_counter() - t0, 4)
+        return out
+
+    database.configure_attributes(cfg["columns"].get("attributes"))
+    stage("init_db", database.init_db, db_path)
+    stage("insert_items", database.bulk_insert_items, make_rows(n, rng, vocab))
+    stage("attributes", database.refresh_attributes)
+    ids, matrix = stage("load_embeddings", database.get_all_embeddings)
+    ann_cfg = cfg["search"].get("ann", {})
+    if ann_cfg.get("enabled", True) and n >= ann_cfg.get("min_items", 100000):
+        index, order = stage("build_ann", build_ivf, ids, matrix, n_lists=ann_cfg.get("n_lists"))
+        ids, matrix = ids[order], matrix[order]
+        save_ivf(db_path, index)
+    else:
+        remove_ivf(db_path)
+    dtype = cfg.get("embedding", {}).get("store_dtype") or "float32"
+    stage("write_store", write_store, db_path, ids, matrix, dtype=dtype)
+    database.bump_generation()
+    search.invalidate_cache()
+    stage("load_store", search._load_embeddings)
+    return stages
+
+
+def measure(fn, queries, warmup=5):
+    """Latency percentiles (ms) and single-client throughput of fn(query),
+    timed over the queries after the first `warmup`."""
+    for q in queries[:warmup]:
+        fn(q)
+    queries = queries[warmup:]
+    times = []
+    t_start = time.perf_counter()
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        times.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - t_start
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+            "qps": round(len(queries) / elapsed, 1)}
+
+
+def bench_catalog(n, args, cfg, vocab):
+    from app import search
+    from app.server import app
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        stages = build_catalog(os.path.join(tmp, "inventory.db"), n, rng, vocab, cfg)
+        tw, vw = cfg["search"]["text_weight"], cfg["search"]["visual_weight"]
+        client = app.test_client()
+
+        def api(q, **params):
+            resp = client.get("/api/search", query_string={"q": q, "limit": args.limit, **params})
+            assert resp.status_code == 200, resp.status_code
+
+        paths = {
+            "text_search": lambda q: database.text_search(search.expand_query(q) or q, limit=args.limit * 5),
+            "visual_search": lambda q: search.visual_search(q, args.limit * 3),
+            "hybrid_search": lambda q: search.hybrid_search(q, tw, vw, limit=args.limit),
+            "api_search": api,
+            "api_search_filtered": lambda q: api(q, price_max=50),
+        }
+        results = {}
+        for name, fn in paths.items():
+            # A fresh query set per path, so no path warms another's caches.
+            results[name] = measure(fn, make_queries(args.queries + 5, rng, vocab))
+        database.close_read_conn()
+    return {"items": n, "import_s": stages, "search": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search on synthetic catalogs")
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200, help="timed queries per search path")
+    parser.add_argument("--limit", type=int, default=60, help="results per page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    install_stub_encoder()
+    from app.config import load_config
+    from app import search
+    cfg = load_config()
+    vocab = vocabulary()
+    search.enable_visual_search()
+
+    quiet = args.json == "-"
+    runs = []
+    for n in args.items:
+        if not quiet:
+            print(f"{n} items...", flush=True)
+        run = bench_catalog(n, args, cfg, vocab)
+        runs.append(run)
+        if not quiet:
+            print("  import " + ", ".join(f"{k} {v:.2f}s" for k, v in run["import_s"].items()))
+            print(f"  {'path':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'qps':>8}")
+            for name, r in run["search"].items():
+                print(f"  {name:<22} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['qps']:>8.1f}")
+
+    report = {
+        "benchmark": "bench_suite",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "queries": args.queries,
+        "limit": args.limit,
+        "seed": args.seed,
+        "runs": runs,
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark visual-search scoring: the old per-item loop vs. the matrix path.
+
+Uses random unit-norm embeddings, so no model or database is needed.
+
+Usage:
+    python benchmarks/bench_visual_search.py
+    python benchmarks/bench_visual_search.py --items 5000 20000 --limit 180
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.search import top_k
+
+DIM = 512
+
+
+def random_unit(n, dim, rng):
+    m = rng.standard_normal((n, dim)).astype(np.float32)
+    m /= np.linalg.norm(m, axis=1, keepdims=True)
+    return m
+
+
+def loop_search(embeddings, query_vec, limit):
+    """The previous implementation: list of (id, vec), one dot per item, full sort."""
+    scores = []
+    for item_id, emb_vec in embeddings:
+        scores.append((item_id, float(np.dot(query_vec, emb_vec))))
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:limit]
+
+
+def matrix_search(ids, matrix, query_vec, limit):
+    scores = matrix @ query_vec
+    best = top_k(scores, limit)
+    return [(int(ids[i]), float(scores[i])) for i in best]
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark visual search scoring")
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 5000, 20000, 100000])
+    parser.add_argument("--limit", type=int, default=180, help="top-k (hybrid_search asks for limit*3)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'items':>8} {'loop ms':>10} {'matrix ms':>10} {'speedup':>8}")
+    for n in args.items:
+        matrix = random_unit(n, DIM, rng)
+        ids = np.arange(1, n + 1, dtype=np.int64)
+        as_list = [(int(i), matrix[j]) for j, i in enumerate(ids)]
+        query_vec = random_unit(1, DIM, rng)[0]
+
+        expected = [i for i, _ in loop_search(as_list, query_vec, args.limit)]
+        got = [i for i, _ in matrix_search(ids, matrix, query_vec, args.limit)]
+        assert expected == got, "matrix path returned a different ranking"
+
+        loop_ms = timeit(lambda: loop_search(as_list, query_vec, args.limit), max(3, args.repeat // 5))
+        mat_ms = timeit(lambda: matrix_search(ids, matrix, query_vec, args.limit), args.repeat)
+        print(f"{n:>8} {loop_ms:>10.2f} {mat_ms:>10.3f} {loop_ms / mat_ms:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
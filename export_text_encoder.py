@@ -0,0 +1,91 @@
+"""
+Export the CLIP text tower for the torch-free serving encoder.
+
+Writes data/clip_text/ (one .npy per text-tower weight, the tokenizer's BPE
+vocabulary and meta.json). serve.py then encodes queries with
+app/text_encoder.py, so the web server needs neither torch nor open_clip.
+Run once on a machine with the full requirements.txt installed, and again
+whenever clip_engine.MODEL_NAME / PRETRAINED change.
+
+Usage:
+    python export_text_encoder.py
+    python export_text_encoder.py --check "red velvet sofa"   (compare with the torch model)
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from app.config import load_config
+from app import text_encoder
+
+# Linear layers are stored transposed, as (in, out), so the numpy forward
+# pass is a plain x @ W.
+_TRANSPOSED = ("attn.in_proj_weight", "attn.out_proj.weight", "mlp.c_fc.weight", "mlp.c_proj.weight")
+
+
+def export(model, model_tag, out_dir):
+    """Write the text tower of an open_clip CLIP model to out_dir."""
+    from open_clip.tokenizer import default_bpe
+
+    state = model.state_dict()
+    names = ["token_embedding.weight", "positional_embedding", "ln_final.weight", "ln_final.bias", "text_projection"]
+    names += [k for k in state if k.startswith("transformer.resblocks.")]
+    first_block = model.transformer.resblocks[0]
+
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in names:
+        arr = state[name].detach().cpu().float().numpy()
+        if name.endswith(_TRANSPOSED):
+            arr = arr.T
+        np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(arr))
+    shutil.copyfile(default_bpe(), os.path.join(tmp_dir, text_encoder.VOCAB_FILE))
+
+    meta = {
+        "model": model_tag,
+        "layers": len(model.transformer.resblocks),
+        "heads": first_block.attn.num_heads,
+        "context_length": int(state["positional_embedding"].shape[0]),
+        "activation": "quick_gelu" if type(first_block.mlp.gelu).__name__ == "QuickGELU" else "gelu",
+        "weights": names,
+    }
+    with open(os.path.join(tmp_dir, text_encoder.META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the CLIP text encoder for torch-free serving")
+    parser.add_argument("--check", nargs="*", metavar="QUERY",
+                        help="after exporting, compare both encoders on these queries")
+    args = parser.parse_args()
+
+    from app import clip_engine
+
+    cfg = load_config()
+    out_dir = text_encoder.artifact_dir(cfg["_db_path"])
+
+    print(f"Loading CLIP model ({clip_engine.MODEL_TAG})...")
+    clip_engine.init_clip()
+    size = export(clip_engine._model, clip_engine.MODEL_TAG, out_dir)
+    print(f"Wrote {out_dir} ({size / 2**20:.0f} MB)")
+
+    if args.check is not None:
+        text_encoder.load_text_encoder(out_dir)
+        for query in args.check or ["red velvet sofa", "gold chiavari chair", "white floral arch"]:
+            diff = np.abs(text_encoder.encode_text(query) - clip_engine.encode_text(query)).max()
+            print(f"  {query!r}: max abs difference {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
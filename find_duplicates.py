@@ -0,0 +1,110 @@
+"""
+Find near-duplicate items in the imported catalog.
+
+Groups items that share an image, or whose image embeddings are nearly
+identical (cosine >= --threshold). Typical causes are size or colour
+variants with the same photo, or fuzzy name matching linking one image to
+several rows. Writes a JSON report (data/duplicates.json by default).
+With --apply, it also flags every item except the first of its group as a
+duplicate, so search can collapse each group to one result
+(search.dedup in config.yaml, or ?dedup=1).
+
+Re-run after imports: import_data.py only clears the flags of items it
+deletes or whose image changes.
+
+Usage:
+    python find_duplicates.py
+    python find_duplicates.py --threshold 0.98 --apply
+    python find_duplicates.py --clear          (remove all duplicate flags)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from app.config import load_config
+from app.database import (
+    init_db, get_image_refs, get_all_embeddings, set_duplicates, bump_generation,
+)
+from app.embedding_store import load_store
+from app.duplicates import embedding_pairs, shared_image_pairs, group, DEFAULT_THRESHOLD
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate catalog items")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"embedding cosine similarity counted as a duplicate (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--report", help="JSON report path (default data/duplicates.json)")
+    parser.add_argument("--apply", action="store_true", help="flag duplicates so search can collapse them")
+    parser.add_argument("--clear", action="store_true", help="remove all duplicate flags and exit")
+    args = parser.parse_args()
+
+    cfg = load_config()
+    db_path = cfg["_db_path"]
+    if not os.path.isfile(db_path):
+        print(f"ERROR: No database at {db_path}. Run import_data.py first.")
+        sys.exit(1)
+    init_db(db_path)
+
+    if args.clear:
+        set_duplicates({})
+        bump_generation()
+        print("Cleared duplicate flags.")
+        return
+
+    items = get_image_refs()
+    names = {item["id"]: item["name"] for item in items}
+    print(f"{len(items)} items")
+
+    links = list(shared_image_pairs(items))
+    print(f"Shared images: {len(links)} links")
+
+    stored = load_store(db_path)
+    ids, matrix = stored if stored is not None else get_all_embeddings()
+    t0 = time.perf_counter()
+    similar = list(embedding_pairs(ids, matrix, args.threshold))
+    print(f"Similar embeddings (>= {args.threshold}): {len(similar)} pairs among {len(ids)} embeddings "
+          f"({time.perf_counter() - t0:.1f}s)")
+
+    groups = group(links + similar)
+    group_of = {item_id: g for g, members in enumerate(groups) for item_id in members}
+    group_links = [[] for _ in groups]
+    for a, b, reason in links + similar:
+        link = {"a": a, "b": b}
+        if isinstance(reason, str):
+            link["reason"] = reason
+        else:
+            link.update(reason="embedding", similarity=round(reason, 4))
+        group_links[group_of[a]].append(link)
+
+    duplicate_of = {}
+    report_groups = []
+    for members, member_links in zip(groups, group_links):
+        for item_id in members[1:]:
+            duplicate_of[item_id] = members[0]
+        report_groups.append({
+            "keep": members[0],
+            "items": [{"id": i, "name": names.get(i, "")} for i in members],
+            "links": member_links,
+        })
+
+    report_path = args.report or os.path.join(os.path.dirname(db_path), "duplicates.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"threshold": args.threshold, "items": len(items), "groups": report_groups}, f, indent=2)
+
+    print(f"{len(groups)} duplicate groups, {len(duplicate_of)} items would collapse")
+    for g in report_groups[:10]:
+        print(f"  {len(g['items'])} x {g['items'][0]['name']!r}")
+    print(f"Report: {report_path}")
+
+    if args.apply:
+        set_duplicates(duplicate_of)
+        bump_generation()
+        print(f"Flagged {len(duplicate_of)} items as duplicates.")
+
+
+if __name__ == "__main__":
+    main()
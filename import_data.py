@@ -3,14 +3,18 @@ Import inventory data from an Excel spreadsheet into the search database.
 
 Usage:
     python import_data.py
-    python import_data.py --clear   (wipe existing data first)
+    python import_data.py --clear         (wipe existing data first)
+    python import_data.py --incremental   (sync changes since the last import)
 """
 
 import os
 import sys
 import re
 import json
+import hashlib
 import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
 
 import pandas as pd
@@ -19,17 +23,28 @@ from tqdm import tqdm
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from app.config import load_config
-from app.database import init_db, clear_items, insert_item
+from app.database import (
+    init_db, clear_items, bulk_insert_items, update_item, delete_items, get_all_embeddings,
+    get_import_state, get_embeddings_for_image_hashes,
+    get_image_fingerprints, save_image_fingerprints, bump_generation, get_thumbnail_names,
+    configure_attributes, refresh_attributes, save_neighbors,
+)
+from app.embedding_store import write_store, remove_store, STORE_DTYPES
+from app.ann_index import build_ivf, save_ivf, remove_ivf
+from app.neighbors import nearest_neighbors, DEFAULT_K
 
 _clip_available = False
 try:
-    from app.clip_engine import init_clip, encode_image
+    from app.clip_engine import init_clip, iter_encode_images
     _clip_available = True
 except ImportError:
     pass
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tiff", ".tif"}
 
+FUZZY_THRESHOLD = 0.88
+FUZZY_CHUNK = 50
+
 
 def normalize_name(s):
     s = s.lower().strip()
@@ -61,6 +76,80 @@ def build_image_index(image_folder):
     return exact, normalized, norm_list
 
 
+def _bigrams(s):
+    return Counter(s[i:i + 2] for i in range(len(s) - 1))
+
+
+def build_fuzzy_index(norm_list):
+    """Inverted index: character bigram -> [(position in norm_list, count)]."""
+    index = defaultdict(list)
+    for pos, (img_norm, _) in enumerate(norm_list):
+        for gram, count in _bigrams(img_norm).items():
+            index[gram].append((pos, count))
+    return index
+
+
+def fuzzy_best_match(norm, norm_list, index, threshold=FUZZY_THRESHOLD):
+    """Best image path whose SequenceMatcher ratio against `norm` is >= threshold.
+
+    Gives the same answer as scoring every entry of norm_list (first entry
+    wins ties) but only runs the full ratio on a shortlist. If a and b have
+    M matching characters in k blocks, the blocks share at least M - k
+    bigrams, and k - 1 <= len(a) + len(b) - 2M. So ratio = 2M/T >= r
+    requires at least (1.5r - 1)T - 1 shared bigrams, where T is the total
+    length; entries below that bound can never reach the threshold.
+    """
+    la = len(norm)
+    if la <= 3:
+        # Too short for the bigram bound to exclude anything.
+        shortlist = range(len(norm_list))
+    else:
+        shared = defaultdict(int)
+        for gram, count in _bigrams(norm).items():
+            for pos, img_count in index.get(gram, ()):
+                shared[pos] += min(count, img_count)
+        shortlist = sorted(
+            pos for pos, n in shared.items()
+            if n >= (1.5 * threshold - 1) * (la + len(norm_list[pos][0])) - 1 - 1e-9
+        )
+
+    best_score = 0
+    best_path = None
+    for pos in shortlist:
+        img_norm, img_path = norm_list[pos]
+        sm = SequenceMatcher(None, norm, img_norm, autojunk=False)
+        if sm.real_quick_ratio() < threshold or sm.quick_ratio() < threshold:
+            continue
+        score = sm.ratio()
+        if score > best_score:
+            best_score = score
+            best_path = img_path
+    return best_path if best_score >= threshold else None
+
+
+_fuzzy_state = None
+
+
+def _init_fuzzy_worker(norm_list):
+    global _fuzzy_state
+    _fuzzy_state = (norm_list, build_fuzzy_index(norm_list))
+
+
+def _fuzzy_match_chunk(chunk):
+    norm_list, index = _fuzzy_state
+    return [(idx, fuzzy_best_match(norm, norm_list, index)) for idx, norm in chunk]
+
+
+def _collect_fuzzy(results, match_map, total):
+    done = 0
+    for chunk_result in results:
+        for idx, path in chunk_result:
+            if path is not None:
+                match_map[idx] = path
+        done += len(chunk_result)
+        print(f"    {done}/{total} fuzzy matches done...")
+
+
 def prematch_all(df, name_col, exact_idx, norm_idx, norm_list):
     """
     Pre-compute product-name -> image-path mapping for all rows.
@@ -88,62 +177,157 @@ def prematch_all(df, name_col, exact_idx, norm_idx, norm_list):
 
     if needs_fuzzy and norm_list:
         print(f"  Running fuzzy match for {len(needs_fuzzy)} remaining items...")
-        for i, (idx, norm) in enumerate(needs_fuzzy):
-            best_score = 0
-            best_path = None
-            for img_norm, img_path in norm_list:
-                score = SequenceMatcher(None, norm, img_norm, autojunk=False).ratio()
-                if score > best_score:
-                    best_score = score
-                    best_path = img_path
-            if best_score >= 0.88:
-                match_map[idx] = best_path
-            if (i + 1) % 100 == 0:
-                print(f"    {i + 1}/{len(needs_fuzzy)} fuzzy matches done...")
+        chunks = [needs_fuzzy[i:i + FUZZY_CHUNK] for i in range(0, len(needs_fuzzy), FUZZY_CHUNK)]
+        if len(chunks) > 1:
+            with ProcessPoolExecutor(initializer=_init_fuzzy_worker, initargs=(norm_list,)) as pool:
+                results = pool.map(_fuzzy_match_chunk, chunks)
+                _collect_fuzzy(results, match_map, len(needs_fuzzy))
+        else:
+            _init_fuzzy_worker(norm_list)
+            _collect_fuzzy(map(_fuzzy_match_chunk, chunks), match_map, len(needs_fuzzy))
 
     return match_map
 
 
-def make_thumbnail(image_path, thumb_dir, thumb_width=300, quality=85):
+def image_fingerprint(path, known=None):
+    """(size, mtime, sha1) for an image file. The hash is reused from `known`
+    (a previous fingerprint) when size and mtime haven't changed."""
+    st = os.stat(path)
+    if known is not None and known[0] == st.st_size and known[1] == st.st_mtime:
+        return known
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return st.st_size, st.st_mtime, h.hexdigest()
+
+
+def row_hash(name, extra_json, image_path):
+    """Hash of the mapped fields of one spreadsheet row."""
+    payload = json.dumps([name, extra_json, os.path.basename(image_path or "")])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def make_thumbnail(image_path, thumb_dir, image_hash, thumb_width=300, quality=85,
+                   widths=(), webp=False):
+    """Write the thumbnail set for one image.
+
+    File names are derived from the source image's content hash plus the
+    width and quality, so a name never refers to different bytes and can be
+    cached by browsers forever. Returns (thumb_name, variants): thumb_name
+    is the primary `thumb_width` JPEG, and variants maps "jpeg"/"webp" to
+    {width: file name} for every size in `widths` (plus the primary width)
+    no wider than the original, for use in srcset. Large JPEGs are decoded
+    in draft mode at the smallest scale that still covers the widest
+    thumbnail.
+    """
     basename = os.path.basename(image_path)
-    name, _ = os.path.splitext(basename)
-    thumb_name = f"{name}_thumb.jpg"
-    thumb_path = os.path.join(thumb_dir, thumb_name)
+    sizes = sorted(set(widths) | {thumb_width})
+    formats = ["jpeg", "webp"] if webp else ["jpeg"]
+
+    def file_for(fmt, w):
+        return f"{image_hash[:16]}_{w}q{quality}.{'jpg' if fmt == 'jpeg' else 'webp'}"
 
-    if os.path.exists(thumb_path):
-        return thumb_name
+    thumb_name = file_for("jpeg", thumb_width)
 
     try:
-        img = Image.open(image_path).convert("RGB")
-        ratio = thumb_width / img.width
-        new_height = int(img.height * ratio)
-        img = img.resize((thumb_width, new_height), Image.LANCZOS)
-        img.save(thumb_path, "JPEG", quality=quality)
-        return thumb_name
+        img = Image.open(image_path)
+        # Image.open only reads the header, so this check stays cheap.
+        keep = [w for w in sizes if w <= img.width or w == thumb_width]
+        if all(os.path.exists(os.path.join(thumb_dir, file_for(f, w)))
+               for f in formats for w in keep):
+            return thumb_name, {f: {str(w): file_for(f, w) for w in keep} for f in formats}
+
+        if img.format == "JPEG":
+            widest = max(keep)
+            img.draft("RGB", (widest, max(1, img.height * widest // img.width)))
+        img = img.convert("RGB")
+
+        variants = {f: {} for f in formats}
+        for w in keep:
+            resized = img.resize((w, max(1, int(img.height * w / img.width))), Image.LANCZOS)
+            for fmt in formats:
+                out = file_for(fmt, w)
+                tmp = os.path.join(thumb_dir, out + ".tmp")
+                resized.save(tmp, fmt.upper(), quality=quality)
+                os.replace(tmp, os.path.join(thumb_dir, out))
+                variants[fmt][str(w)] = out
+        return thumb_name, variants
     except Exception as e:
         print(f"  Warning: thumbnail failed for {basename}: {e}")
-        return ""
+        return "", {}
+
+
+def _thumbnail_job(args):
+    image_path, image_hash, thumb_dir, opts = args
+    return image_path, make_thumbnail(image_path, thumb_dir, image_hash, **opts)
+
+
+def build_thumbnails(jobs, thumb_dir, opts, workers=None):
+    """Run make_thumbnail for (image_path, image_hash) jobs on a process pool.
+    Returns {image_path: (thumb_name, variants)}."""
+    tasks = [(path, image_hash, thumb_dir, opts) for path, image_hash in jobs]
+    if len(tasks) < 2:
+        return dict(map(_thumbnail_job, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_thumbnail_job, tasks, chunksize=16)
+        return dict(tqdm(results, total=len(tasks), desc="Thumbnails"))
+
+
+def write_thumbnail_manifest(manifest_path, thumb_dir, names):
+    """Record {file name: size} for every thumbnail in use, so the server can
+    answer thumbnail requests without touching the filesystem first."""
+    manifest = {}
+    for name in sorted(names):
+        path = os.path.join(thumb_dir, name)
+        if os.path.isfile(path):
+            manifest[name] = os.path.getsize(path)
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+    return len(manifest)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Import inventory data")
     parser.add_argument("--clear", action="store_true", help="Clear existing data before importing")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only write new or changed rows and delete rows that disappeared")
     args = parser.parse_args()
+    if args.clear and args.incremental:
+        parser.error("--clear and --incremental cannot be combined")
 
     cfg = load_config()
     spreadsheet = cfg["spreadsheet"]
     image_folder = cfg["image_folder"]
     col_map = cfg["columns"]
     thumb_cfg = cfg.get("thumbnails", {})
-    thumb_width = thumb_cfg.get("width", 300)
-    thumb_quality = thumb_cfg.get("quality", 85)
+    thumb_opts = {
+        "thumb_width": thumb_cfg.get("width", 300),
+        "quality": thumb_cfg.get("quality", 85),
+        "widths": tuple(thumb_cfg.get("widths", ())),
+        "webp": thumb_cfg.get("webp", False),
+    }
     thumb_dir = cfg["_thumb_dir"]
+    emb_cfg = cfg.get("embedding", {})
+    store_dtype = emb_cfg.get("store_dtype") or "float32"
     db_path = cfg["_db_path"]
 
     print(f"Spreadsheet : {spreadsheet}")
     print(f"Image folder: {image_folder}")
     print()
 
+    if store_dtype not in STORE_DTYPES:
+        print(f"ERROR: embedding.store_dtype must be one of {', '.join(STORE_DTYPES)}, not {store_dtype!r}")
+        sys.exit(1)
+
+    try:
+        configure_attributes(col_map.get("attributes"))
+    except (ValueError, KeyError, AttributeError) as e:
+        print(f"ERROR: columns.attributes: {e}")
+        sys.exit(1)
+
     if not os.path.isfile(spreadsheet):
         print(f"ERROR: Spreadsheet not found: {spreadsheet}")
         sys.exit(1)
@@ -169,6 +353,7 @@ def main():
     if args.clear:
         print("Clearing existing data...")
         clear_items()
+        remove_store(db_path)
 
     match_map = {}
     if has_images:
@@ -192,11 +377,14 @@ def main():
 
     os.makedirs(thumb_dir, exist_ok=True)
 
-    print("Importing items...")
-    imported = 0
+    print("Preparing rows...")
+    records = []
     skipped = 0
+    key_counts = Counter()
+    known_files = get_image_fingerprints()
+    fingerprints = {}
 
-    for idx, row in tqdm(df.iterrows(), total=len(df), desc="Importing"):
+    for idx, row in tqdm(df.iterrows(), total=len(df), desc="Preparing"):
         name = str(row.get(name_col, "")).strip()
         if not name:
             skipped += 1
@@ -217,25 +405,150 @@ def main():
         extra_json = json.dumps(extra) if extra else ""
 
         image_path = match_map.get(idx)
+        image_hash = None
+        if image_path:
+            if image_path not in fingerprints:
+                fingerprints[image_path] = image_fingerprint(image_path, known_files.get(image_path))
+            image_hash = fingerprints[image_path][2]
+
+        base_key = extra.get("Product Id") or name
+        key_counts[base_key] += 1
+        row_key = base_key if key_counts[base_key] == 1 else f"{base_key}#{key_counts[base_key]}"
+
+        records.append({
+            "name": name,
+            "extra_json": extra_json,
+            "image_path": image_path,
+            "image_hash": image_hash,
+            "row_key": row_key,
+            "row_hash": row_hash(name, extra_json, image_path),
+        })
+
+    save_image_fingerprints(fingerprints)
+
+    existing = get_import_state() if args.incremental else {}
+    unchanged = 0
+    pending = []
+    for rec in records:
+        prev = existing.pop(rec["row_key"], None)
+        if prev is not None and prev[1] == rec["row_hash"] and prev[2] == rec["image_hash"]:
+            unchanged += 1
+            continue
+        rec["item_id"] = prev[0] if prev else None
+        rec["image_changed"] = prev is None or prev[2] != rec["image_hash"]
+        pending.append(rec)
+    removed_ids = [item_id for item_id, _, _ in existing.values()]
+    updates = [r for r in pending if r["item_id"] is not None]
+    inserts = [r for r in pending if r["item_id"] is None]
+    pending = updates + inserts
+
+    # Images whose content is already embedded on another row are reused;
+    # each remaining distinct image is encoded once, in first-use order, so
+    # the streamed results line up with the rows that need them.
+    embeddings = {}
+    if args.incremental:
+        embeddings = get_embeddings_for_image_hashes(
+            {r["image_hash"] for r in pending if r["image_hash"] and r["image_changed"]}
+        )
+    encoded = iter(())
+    if has_images and _clip_available:
+        # Keyed on content, like load_row: copies of one image under
+        # different file names are encoded once.
+        first_path = {}
+        for r in pending:
+            if r["image_path"] and r["image_changed"] and r["image_hash"] not in embeddings:
+                first_path.setdefault(r["image_hash"], r["image_path"])
+        encoded = iter_encode_images(
+            list(first_path.values()),
+            batch_size=emb_cfg.get("batch_size", 32),
+            workers=emb_cfg.get("workers", 4),
+            prefetch=emb_cfg.get("prefetch", 2),
+        )
+
+    if args.incremental:
+        print(f"{unchanged} unchanged, {len(pending)} new or changed, {len(removed_ids)} removed")
+
+    thumb_jobs = {r["image_path"]: r["image_hash"] for r in pending if r["image_path"]}
+    print("Generating thumbnails...")
+    thumbs = build_thumbnails(thumb_jobs.items(), thumb_dir, thumb_opts, thumb_cfg.get("workers"))
+
+    def load_row(rec):
+        """Thumbnails and embedding for a pending row, pulled in pending order."""
+        image_path = rec["image_path"]
+        image_hash = rec["image_hash"]
+
+        thumb_file, thumb_variants = thumbs.get(image_path, ("", {}))
 
-        thumb_file = ""
         embedding = None
+        if image_path and rec["image_changed"] and _clip_available:
+            if image_hash not in embeddings:
+                path, vec, err = next(encoded)
+                if err is not None:
+                    print(f"  Warning: CLIP failed for {rec['name']}: {err}")
+                embeddings[fingerprints[path][2]] = vec
+            embedding = embeddings[image_hash]
+        return thumb_file, json.dumps(thumb_variants) if thumb_variants else "", embedding
+
+    if updates:
+        print("Updating changed items...")
+        for rec in tqdm(updates, desc="Updating"):
+            thumb_file, thumb_variants, embedding = load_row(rec)
+            update_item(rec["item_id"], rec["name"], "", rec["extra_json"], rec["name"], thumb_file,
+                        embedding, row_hash=rec["row_hash"], image_hash=rec["image_hash"],
+                        keep_embedding=not rec["image_changed"], thumb_variants=thumb_variants)
+
+    def new_rows():
+        for rec in tqdm(inserts, desc="Importing"):
+            thumb_file, thumb_variants, embedding = load_row(rec)
+            yield (rec["name"], "", rec["extra_json"], rec["name"], thumb_file, embedding,
+                   rec["row_key"], rec["row_hash"], rec["image_hash"], thumb_variants)
 
-        if image_path:
-            thumb_file = make_thumbnail(image_path, thumb_dir, thumb_width, thumb_quality)
-            if _clip_available:
-                try:
-                    embedding = encode_image(image_path)
-                except Exception as e:
-                    print(f"  Warning: CLIP failed for {name}: {e}")
-
-        insert_item(name, "", extra_json, name, thumb_file, embedding)
-        imported += 1
+    print("Importing items...")
+    imported = len(updates) + bulk_insert_items(new_rows())
+
+    if removed_ids:
+        print(f"Removing {len(removed_ids)} rows no longer in the spreadsheet...")
+        delete_items(removed_ids)
+
+    if col_map.get("attributes"):
+        print("Updating filter attributes...")
+        refresh_attributes()
+
+    if thumb_cfg.get("manifest", True):
+        count = write_thumbnail_manifest(cfg["_thumb_manifest"], thumb_dir, get_thumbnail_names())
+        print(f"Thumbnail manifest lists {count} files")
+
+    emb_ids, emb_matrix = get_all_embeddings()
+    ann_cfg = cfg["search"].get("ann", {})
+    if ann_cfg.get("enabled", True) and len(emb_ids) >= ann_cfg.get("min_items", 100000):
+        print("Building approximate nearest-neighbour index...")
+        ann_index, order = build_ivf(emb_ids, emb_matrix, n_lists=ann_cfg.get("n_lists"))
+        emb_ids, emb_matrix = emb_ids[order], emb_matrix[order]
+        save_ivf(db_path, ann_index)
+    else:
+        ann_index = None
+        remove_ivf(db_path)
+
+    print("Writing embedding store...")
+    write_store(db_path, emb_ids, emb_matrix, dtype=store_dtype)
+    print(f"Stored {len(emb_ids)} embeddings for memory-mapped search"
+          + (f" (+ {store_dtype} copy)" if store_dtype != "float32" else ""))
+    similar_cfg = cfg["search"].get("similar", {})
+    if similar_cfg.get("enabled", True) and len(emb_ids) > 1:
+        print("Computing similar items...")
+        neighbors = nearest_neighbors(emb_ids, emb_matrix, k=similar_cfg.get("k", DEFAULT_K), index=ann_index,
+                                      nprobe=similar_cfg.get("nprobe", 32))
+        save_neighbors(tqdm(neighbors, total=len(emb_ids), desc="Similar items"))
+    else:
+        save_neighbors([])
+    bump_generation()
 
     print()
     print(f"Done! Imported {imported} items, skipped {skipped} empty rows.")
+    if args.incremental:
+        print(f"Unchanged: {unchanged}, removed: {len(removed_ids)}")
     if has_images:
-        print(f"Images matched: {len(match_map)} / {imported}")
+        print(f"Images matched: {len(match_map)} / {len(records)}")
     print(f"Database: {db_path}")
     print(f"Run 'python serve.py' to start the search server.")
 
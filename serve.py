@@ -3,27 +3,78 @@ Start the Inventory Lookup web server.
 Usage:
     python serve.py           (development)
     gunicorn serve:app        (production / Azure)
+
+Requests are answered from text search immediately; the CLIP query encoder
+and image embeddings load on a background thread in each worker (so don't
+use gunicorn --preload). /readyz reports 503 until that has finished.
 """
 import sys
 import os
+import threading
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app.config import load_config
-from app.server import create_app
-from app.search import _load_embeddings
+from app.server import create_app, set_warming_up
+from app.search import _load_embeddings, enable_visual_search
+from app import text_encoder
+from app.text_cache import set_encoder, init_text_cache, warmup
 
 cfg = load_config()
 flask_app = create_app()
 
-try:
-    from app.clip_engine import init_clip
+
+def load_query_encoder():
+    """(encode_text, model_tag, encode_texts) for search.text_encoder, or None if unavailable.
+
+    "auto" uses the torch-free export in data/clip_text/ when it exists
+    and falls back to the full open_clip model.
+    """
+    backend = cfg["search"].get("text_encoder", "auto")
+    path = text_encoder.artifact_dir(cfg["_db_path"])
+    if backend != "torch" and text_encoder.available(path):
+        print("Loading exported CLIP text encoder...")
+        return text_encoder.encode_text, text_encoder.load_text_encoder(path), text_encoder.encode_texts
+    if backend == "exported":
+        print(f"No exported text encoder in {path} — run export_text_encoder.py.")
+        return None
+    try:
+        from app.clip_engine import init_clip, encode_text, encode_texts, MODEL_TAG
+    except ImportError:
+        return None
     print("Loading CLIP model...")
     init_clip()
-    print("Loading image embeddings into memory...")
-    _load_embeddings()
-except ImportError:
-    print("CLIP not available — running text search only.")
+    return encode_text, MODEL_TAG, encode_texts
+
+
+def warm_up():
+    """Load the query encoder and embeddings, then switch search to hybrid mode.
+    Runs on a background thread so the server answers (text-only) right away."""
+    try:
+        encoder = load_query_encoder()
+        if encoder is None:
+            print("CLIP not available — running text search only.")
+            return
+        set_encoder(*encoder)
+        print("Loading image embeddings into memory...")
+        _load_embeddings()
+        qc_cfg = cfg["search"].get("query_cache", {})
+        init_text_cache(cfg["_db_path"], qc_cfg.get("size", 1024))
+        if qc_cfg.get("warmup", False):
+            from app.search import SYNONYMS
+            print("Warming up query embedding cache...")
+            loaded, encoded = warmup(SYNONYMS.keys(), qc_cfg.get("warmup_top", 200))
+            print(f"  {loaded} cached queries loaded, {encoded} new words encoded")
+        enable_visual_search()
+        print("Visual search ready.")
+    except Exception as e:
+        print(f"Visual search failed to load ({e}) — running text search only.")
+    finally:
+        set_warming_up(False)
+
+
+set_warming_up(True)
+threading.Thread(target=warm_up, name="search-warmup", daemon=True).start()
 
 app = flask_app
 
@@ -9,25 +9,71 @@ const modal = document.getElementById("modal");
 
 let debounceTimer = null;
 const DEBOUNCE_MS = 400;
+const PAGE_SIZE = 60;
+
+// Infinite scroll: the URL of the next page (null when there is none), and
+// a counter so pages of a superseded search are dropped.
+let nextPageUrl = null;
+let loadingMore = false;
+let searchSeq = 0;
+let shownCount = 0;
+let shownTotal = 0;
+const scrollSentinel = document.createElement("div");
+resultsEl.after(scrollSentinel);
+const CARD_SIZES = "(max-width: 640px) 50vw, 260px";
+const MODAL_SIZES = "(max-width: 640px) 100vw, 400px";
+const SIMILAR_SIZES = "120px";
+const SIMILAR_COUNT = 12;
+
+const SUPPORTS_WEBP = document.createElement("canvas").toDataURL("image/webp").startsWith("data:image/webp");
+
+function thumbSrcset(item) {
+    const thumbs = item.thumbs || {};
+    const variants = (SUPPORTS_WEBP && thumbs.webp) || thumbs.jpeg;
+    if (!variants) return "";
+    return Object.entries(variants)
+        .map(([width, file]) => `/thumbnails/${encodeURIComponent(file)} ${width}w`)
+        .join(", ");
+}
+
+function setThumb(img, item, sizes) {
+    img.src = `/thumbnails/${item.thumb_file}`;
+    img.srcset = thumbSrcset(item);
+    img.sizes = sizes;
+}
+
+function withCursor(url, cursor) {
+    return cursor ? `${url}${url.includes("?") ? "&" : "?"}cursor=${encodeURIComponent(cursor)}` : null;
+}
+
+function updateCount(query, category) {
+    const more = nextPageUrl ? "+" : "";
+    countEl.textContent = query || category
+        ? `${shownCount}${more} result${shownCount !== 1 || more ? "s" : ""}`
+        : `${shownTotal || shownCount} items`;
+}
 
 async function doSearch() {
     const query = searchInput.value.trim();
     const category = categoryFilter.value;
+    const seq = ++searchSeq;
 
     loadingEl.classList.add("active");
     resultsEl.innerHTML = "";
     emptyEl.style.display = "none";
+    nextPageUrl = null;
 
     try {
         let url;
         if (category) {
             url = `/api/category/${encodeURIComponent(category)}`;
         } else {
-            url = `/api/search?q=${encodeURIComponent(query)}&limit=60`;
+            url = `/api/search?q=${encodeURIComponent(query)}&limit=${PAGE_SIZE}`;
         }
 
         const resp = await fetch(url);
         const data = await resp.json();
+        if (seq !== searchSeq) return;
         const items = data.items || [];
 
         loadingEl.classList.remove("active");
@@ -38,19 +84,55 @@ async function doSearch() {
             return;
         }
 
-        countEl.textContent = query || category
-            ? `${items.length} result${items.length !== 1 ? "s" : ""}`
-            : `${data.total || items.length} items`;
+        shownCount = items.length;
+        shownTotal = data.total;
+        nextPageUrl = withCursor(url, data.next);
+        updateCount(query, category);
 
         renderCards(items);
+        fillViewport();
     } catch (err) {
         loadingEl.classList.remove("active");
         resultsEl.innerHTML = `<p style="color:red;padding:20px;">Search error: ${err.message}</p>`;
     }
 }
 
-function renderCards(items) {
-    resultsEl.innerHTML = "";
+async function loadMore() {
+    if (!nextPageUrl || loadingMore) return;
+    const seq = searchSeq;
+    const url = nextPageUrl;
+    loadingMore = true;
+    try {
+        const resp = await fetch(url);
+        const data = await resp.json();
+        if (seq !== searchSeq) return;
+        const items = data.items || [];
+        shownCount += items.length;
+        nextPageUrl = withCursor(url.replace(/&cursor=[^&]*/, ""), data.next);
+        updateCount(searchInput.value.trim(), categoryFilter.value);
+        renderCards(items, true);
+    } catch (_) {
+        nextPageUrl = null;
+    } finally {
+        loadingMore = false;
+    }
+    fillViewport();
+}
+
+// The observer only fires when the sentinel's visibility changes, so keep
+// loading while a short page leaves it on screen.
+function fillViewport() {
+    if (nextPageUrl && scrollSentinel.getBoundingClientRect().top < window.innerHeight + 600) {
+        loadMore();
+    }
+}
+
+new IntersectionObserver(entries => {
+    if (entries[0].isIntersecting) loadMore();
+}, { rootMargin: "600px" }).observe(scrollSentinel);
+
+function renderCards(items, append = false) {
+    if (!append) resultsEl.innerHTML = "";
     const frag = document.createDocumentFragment();
 
     items.forEach(item => {
@@ -62,7 +144,7 @@ function renderCards(items) {
             const img = document.createElement("img");
             img.className = "card-img";
             img.loading = "lazy";
-            img.src = `/thumbnails/${item.thumb_file}`;
+            setThumb(img, item, CARD_SIZES);
             img.alt = item.name;
             img.onerror = function () {
                 this.outerHTML = `<div class="card-img no-img">No image</div>`;
@@ -104,7 +186,7 @@ function openModal(item) {
 
     const img = document.getElementById("modalImg");
     if (item.thumb_file) {
-        img.src = `/thumbnails/${item.thumb_file}`;
+        setThumb(img, item, MODAL_SIZES);
         img.alt = item.name;
         img.style.display = "";
     } else {
@@ -129,6 +211,51 @@ function openModal(item) {
 
     modal.style.display = "";
     document.body.style.overflow = "hidden";
+    modal.querySelector(".modal-content").scrollTop = 0;
+    loadSimilar(item);
+}
+
+// "More like this": precomputed at import, so this is one quick request.
+let similarSeq = 0;
+
+async function loadSimilar(item) {
+    const seq = ++similarSeq;
+    const section = document.getElementById("modalSimilar");
+    const grid = document.getElementById("modalSimilarGrid");
+    section.style.display = "none";
+    grid.innerHTML = "";
+    try {
+        const resp = await fetch(`/api/items/${item.id}/similar?limit=${SIMILAR_COUNT}`);
+        if (!resp.ok) return;
+        const data = await resp.json();
+        if (seq !== similarSeq || !(data.items || []).length) return;
+        const frag = document.createDocumentFragment();
+        data.items.forEach(other => {
+            const card = document.createElement("div");
+            card.className = "similar-card";
+            card.title = other.name;
+            card.addEventListener("click", () => openModal(other));
+            if (other.thumb_file) {
+                const img = document.createElement("img");
+                img.loading = "lazy";
+                setThumb(img, other, SIMILAR_SIZES);
+                img.alt = other.name;
+                card.appendChild(img);
+            } else {
+                const placeholder = document.createElement("div");
+                placeholder.className = "no-img";
+                card.appendChild(placeholder);
+            }
+            const name = document.createElement("div");
+            name.textContent = other.name;
+            card.appendChild(name);
+            frag.appendChild(card);
+        });
+        grid.appendChild(frag);
+        section.style.display = "";
+    } catch (_) {
+        // Similar items are optional; the modal works without them.
+    }
 }
 
 function closeModal() {
@@ -16,10 +16,33 @@ const modal = document.getElementById("modal");
 const modalImg = document.getElementById("modalImg");
 const modalName = document.getElementById("modalName");
 const modalExtra = document.getElementById("modalExtra");
+const modalSimilar = document.getElementById("modalSimilar");
+const modalSimilarGrid = document.getElementById("modalSimilarGrid");
 
 const selectedItems = new Map();
 const searchResultsById = new Map();
 let debounceTimer = null;
+const CARD_SIZES = "(max-width: 640px) 50vw, 220px";
+const MODAL_SIZES = "(max-width: 640px) 100vw, 400px";
+const SIMILAR_SIZES = "120px";
+const SIMILAR_COUNT = 12;
+
+const SUPPORTS_WEBP = document.createElement("canvas").toDataURL("image/webp").startsWith("data:image/webp");
+
+function thumbSrcset(item) {
+    const thumbs = item.thumbs || {};
+    const variants = (SUPPORTS_WEBP && thumbs.webp) || thumbs.jpeg;
+    if (!variants) return "";
+    return Object.entries(variants)
+        .map(([width, file]) => `/thumbnails/${encodeURIComponent(file)} ${width}w`)
+        .join(", ");
+}
+
+function setThumb(img, item, sizes) {
+    img.src = `/thumbnails/${item.thumb_file}`;
+    img.srcset = thumbSrcset(item);
+    img.sizes = sizes;
+}
 
 function parseMoney(value) {
     const n = parseFloat(value);
@@ -89,7 +112,7 @@ function renderResults(items) {
             const img = document.createElement("img");
             img.className = "card-img";
             img.loading = "lazy";
-            img.src = `/thumbnails/${item.thumb_file}`;
+            setThumb(img, item, CARD_SIZES);
             img.alt = item.name;
             img.addEventListener("dblclick", () => openModal(item));
             img.onerror = function () {
@@ -157,7 +180,7 @@ function renderSelected() {
         row.className = "selected-item";
 
         const imgHtml = entry.item.thumb_file
-            ? `<img src="/thumbnails/${escHtml(entry.item.thumb_file)}" alt="${escHtml(entry.item.name)}" draggable="true" data-preview-id="${id}" title="Double-click for details">`
+            ? `<img src="/thumbnails/${escHtml(entry.item.thumb_file)}" srcset="${escHtml(thumbSrcset(entry.item))}" sizes="56px" alt="${escHtml(entry.item.name)}" draggable="true" data-preview-id="${id}" title="Double-click for details">`
             : `<div class="card-img no-img" style="width:56px;height:56px;">No image</div>`;
 
         row.innerHTML = `
@@ -263,7 +286,7 @@ function exportCsv() {
 function openModal(item) {
     modalName.textContent = item.name || "Item details";
     if (item.thumb_file) {
-        modalImg.src = `/thumbnails/${item.thumb_file}`;
+        setThumb(modalImg, item, MODAL_SIZES);
         modalImg.alt = item.name || "Inventory item";
         modalImg.style.display = "";
     } else {
@@ -293,6 +316,49 @@ function openModal(item) {
 
     modal.style.display = "";
     document.body.style.overflow = "hidden";
+    modal.querySelector(".modal-content").scrollTop = 0;
+    loadSimilar(item);
+}
+
+// "More like this": precomputed at import, so this is one quick request.
+let similarSeq = 0;
+
+async function loadSimilar(item) {
+    const seq = ++similarSeq;
+    modalSimilar.style.display = "none";
+    modalSimilarGrid.innerHTML = "";
+    try {
+        const resp = await fetch(`/api/items/${item.id}/similar?limit=${SIMILAR_COUNT}`);
+        if (!resp.ok) return;
+        const data = await resp.json();
+        if (seq !== similarSeq || !(data.items || []).length) return;
+        const frag = document.createDocumentFragment();
+        data.items.forEach(other => {
+            const card = document.createElement("div");
+            card.className = "similar-card";
+            card.title = `${other.name} - ${money(getPrice(other))} / day`;
+            card.addEventListener("click", () => openModal(other));
+            if (other.thumb_file) {
+                const img = document.createElement("img");
+                img.loading = "lazy";
+                setThumb(img, other, SIMILAR_SIZES);
+                img.alt = other.name;
+                card.appendChild(img);
+            } else {
+                const placeholder = document.createElement("div");
+                placeholder.className = "no-img";
+                card.appendChild(placeholder);
+            }
+            const name = document.createElement("div");
+            name.textContent = other.name;
+            card.appendChild(name);
+            frag.appendChild(card);
+        });
+        modalSimilarGrid.appendChild(frag);
+        modalSimilar.style.display = "";
+    } catch (_) {
+        // Similar items are optional; the modal works without them.
+    }
 }
 
 function closeModal() {
@@ -0,0 +1,42 @@
+"""Duplicate flags kept consistent through deletes and image changes."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database.configure_attributes({})
+    database.init_db(str(tmp_path / "inventory.db"))
+    database.bulk_insert_items([(name, "", "{}", "", "", None, f"k{name}", None, None, "") for name in "ABCDE"])
+    database.set_duplicates({2: 1, 3: 1, 4: 1})
+    yield
+    database.close_read_conn()
+
+
+def browse_ids():
+    items, _ = database.get_items_page(limit=50, dedup=True)
+    return [item["id"] for item in items]
+
+
+def test_deleting_the_kept_item_keeps_the_group_together(db):
+    database.delete_items([1])
+    assert database.get_duplicate_map() == {3: 2, 4: 2}
+    assert browse_ids() == [2, 5]
+
+
+def test_new_image_on_the_kept_item_regroups_the_rest(db):
+    database.update_item(1, "A", "", "{}", "", "", None)
+    assert database.get_duplicate_map() == {3: 2, 4: 2}
+    assert browse_ids() == [1, 2, 5]
+
+
+def test_new_image_on_a_member_only_moves_that_member(db):
+    database.update_item(3, "C", "", "{}", "", "", None)
+    assert database.get_duplicate_map() == {2: 1, 4: 1}
+    assert browse_ids() == [1, 3, 5]
@@ -0,0 +1,91 @@
+"""
+End-to-end checks of import_data.main on a tiny catalog.
+
+The spreadsheet is a DataFrame handed to a patched pd.read_excel and the
+CLIP image encoder is a stub returning a vector per file content, so no
+model or Excel file is needed.
+"""
+
+import os
+import sys
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import import_data
+from app import database
+from app.config import load_config
+
+DIM = 8
+
+
+def fake_encode_images(paths, **_):
+    """(path, vector, error) per path, the vector seeded from the file bytes."""
+    for path in paths:
+        with open(path, "rb") as f:
+            seed = int.from_bytes(hashlib.sha1(f.read()).digest()[:8], "little")
+        vec = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+        yield path, vec / np.linalg.norm(vec), None
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    images = tmp_path / "images"
+    images.mkdir()
+    Image.new("RGB", (64, 64), "red").save(images / "Red Chair.jpg")
+    shutil.copy(images / "Red Chair.jpg", images / "Red Chair Large.jpg")
+    Image.new("RGB", (64, 64), "blue").save(images / "Blue Sofa.jpg")
+    rows = pd.DataFrame({"Product Name": ["Red Chair", "Red Chair Large", "Blue Sofa"]})
+
+    cfg = load_config()
+    cfg.update(spreadsheet=str(tmp_path / "inventory.xlsx"), image_folder=str(images),
+               _db_path=str(tmp_path / "data" / "inventory.db"), _thumb_dir=str(tmp_path / "thumbnails"),
+               _thumb_manifest=str(tmp_path / "thumbnails" / "manifest.json"))
+    cfg["columns"] = {"name": "Product Name", "extra": []}
+    cfg["thumbnails"] = {"workers": 1}
+    open(cfg["spreadsheet"], "wb").close()
+
+    monkeypatch.setattr(import_data, "load_config", lambda: cfg)
+    monkeypatch.setattr(import_data.pd, "read_excel", lambda path: rows)
+    monkeypatch.setattr(import_data, "_clip_available", True)
+    monkeypatch.setattr(import_data, "init_clip", lambda: None, raising=False)
+    monkeypatch.setattr(import_data, "iter_encode_images", fake_encode_images, raising=False)
+    yield cfg
+    database.close_read_conn()
+
+
+def run_import(monkeypatch, *flags):
+    monkeypatch.setattr(sys, "argv", ["import_data.py", *flags])
+    import_data.main()
+
+
+def embeddings_by_name():
+    conn = database._connect()
+    rows = conn.execute(
+        "SELECT i.name, e.embedding FROM items i JOIN item_embeddings e ON e.item_id = i.id"
+    ).fetchall()
+    conn.close()
+    return {r["name"]: np.frombuffer(r["embedding"], dtype=np.float32) for r in rows}
+
+
+@pytest.mark.parametrize("flags", [(), ("--incremental",)])
+def test_copies_of_one_image_share_an_embedding(catalog, monkeypatch, flags):
+    run_import(monkeypatch, *flags)
+    emb = embeddings_by_name()
+    assert sorted(emb) == ["Blue Sofa", "Red Chair", "Red Chair Large"]
+    np.testing.assert_array_equal(emb["Red Chair"], emb["Red Chair Large"])
+    (_, sofa, _), = fake_encode_images([os.path.join(catalog["image_folder"], "Blue Sofa.jpg")])
+    np.testing.assert_array_equal(emb["Blue Sofa"], sofa)
+
+
+def test_text_only_import_with_int8_store(catalog, monkeypatch):
+    catalog["image_folder"] = os.path.join(os.path.dirname(catalog["spreadsheet"]), "missing")
+    catalog["embedding"] = {**catalog.get("embedding", {}), "store_dtype": "int8"}
+    run_import(monkeypatch)
+    assert embeddings_by_name() == {}
+    assert database.get_generation() == 1